@@ -2,8 +2,11 @@ import click
 
 
 @click.group(help='Commands marked with (LIVE) require SC launch and windows environment.')
-def bwmap():
-    pass
+@click.option('--cache-dir', default=None, help='Keep map analysis results in this folder between runs')
+def bwmap(cache_dir):
+    if cache_dir is not None:
+        from .cache import ANALYSIS_CACHE, DiskCache
+        ANALYSIS_CACHE.disk = DiskCache(cache_dir)
 
 
 @bwmap.command(help='(LIVE) Make data snapshot for map, which can be used in mock objects later')
@@ -12,6 +15,16 @@ def snapshot():
     save_map_from_bwapi()
 
 
+@bwmap.command(help='Convert PNG + JSON map snapshots to single file format, all unconverted ones by default')
+@click.argument('maphashes', nargs=-1)
+@click.option('--remove-old', is_flag=True, help='Delete old format files after conversion')
+def convert(maphashes, remove_old):
+    from .tests.snapshot import convert_snapshot, old_snapshots
+    for maphash in maphashes or old_snapshots():
+        convert_snapshot(maphash, remove_old)
+        click.echo('Map {} converted'.format(maphash))
+
+
 @bwmap.command(help='(LIVE) Check map buildtiles')
 def buildable_test():
     from .tests.buildable import detect_bads
@@ -26,18 +39,32 @@ def buildable_refine():
 
 @bwmap.command(help='Find & render best places for bases using map snapshot')
 @click.argument('maphash')
-def findbases(maphash):
+@click.option('--workers', default=1, help='Processes for floods, 0 for all cores')
+def findbases(maphash, workers):
     from .resources import BaseFinder
     from .metrics import MapMetrics
+    from .parallel import AnalysisPool
     from .tests.mocks import PybroodMock
     from .tests.render import render_map
 
     pybrood = PybroodMock(maphash)
     mm = MapMetrics.from_pybrood(pybrood)
-    valid_bases = BaseFinder(pybrood.game, mm)()
+    with AnalysisPool(workers or None) as pool:
+        valid_bases = BaseFinder(pybrood.game, mm, pool)()
     render_map(pybrood.game, mm, valid_bases)
 
 
+@bwmap.command(help='Find bases and chokes of every map snapshot in folder, skips maps with current results')
+@click.option('--data-dir', default=None, help='Folder of map snapshots, tests data folder by default')
+@click.option('--output-dir', default='analysis', help='Results are written here, json and npz per map')
+@click.option('--workers', default=1, help='Processes analyzing maps (all of them analyze a single map), 0 for all cores')
+@click.option('--render', is_flag=True, help='Render png per map as well')
+@click.option('--force', is_flag=True, help='Analyze maps with current results too')
+def analyze_all(data_dir, output_dir, workers, render, force):
+    from .tests.batch import analyze_all
+    analyze_all(data_dir, output_dir, workers or None, render, force, log=click.echo)
+
+
 @bwmap.command(help='Find & render v2')
 @click.argument('maphash')
 def findbases2(maphash):
@@ -52,6 +79,44 @@ def nodemerge(maphash):
     node_merge(maphash)
 
 
+@bwmap.command(help='Time node merging algorithms on map snapshots')
+@click.argument('maphashes', nargs=-1, required=True)
+@click.option('--repeat', default=3, help='Best time of this many runs is reported')
+def mergebench(maphashes, repeat):
+    from .tests.floods import merge_benchmark
+    merge_benchmark(maphashes, repeat)
+
+
+@bwmap.command(help='Time analysis stages on synthetic maps, compare with baseline')
+@click.option('--size', 'sizes', type=int, multiple=True, help='Map side in walk tiles, 128, 512 and 1024 by default')
+@click.option('--stage', 'stages', multiple=True, help='Run only these stages')
+@click.option('--repeat', default=3, help='Best time of this many runs is reported')
+@click.option('--baseline', default='bench_baseline.json', help='Baseline json of earlier run')
+@click.option('--save', is_flag=True, help='Store results as new baseline')
+def bench(sizes, stages, repeat, baseline, save):
+    from os.path import exists
+    from .tests.bench import SIZES, run_benchmarks, check_stages, compare, load_baseline, save_baseline
+
+    try:
+        check_stages(stages)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--stage')
+    results = run_benchmarks(sizes or SIZES, repeat, stages, log=click.echo)
+    if save:
+        save_baseline(baseline, results)
+        click.echo('Baseline saved to {}'.format(baseline))
+        return
+    if not exists(baseline):
+        click.echo('No baseline {}, run with --save to make it'.format(baseline))
+        return
+    regressions = compare(results, load_baseline(baseline))
+    for size, name, measure, before, after in regressions:
+        click.echo('REGRESSION {} {} {}: {:.4g} -> {:.4g}'.format(size, name, measure, before, after))
+    if regressions:
+        raise SystemExit(1)
+    click.echo('No regressions against {}'.format(baseline))
+
+
 @bwmap.command(help='Find choke points')
 @click.argument('maphash')
 def chokes(maphash):
@@ -0,0 +1,175 @@
+import os
+import json
+import shutil
+from os.path import join, exists
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Increase on any change of analysis algorithms, results cached on disk by older versions are ignored
+ANALYSIS_VERSION = 7
+
+
+class DiskCache:
+    """
+    Persistent storage of map analysis products:
+        <root>/<map hash>/v<version>/<key>.npy (or .json)
+    Arrays are loaded memory-mapped (read-only), so loading is nearly free.
+    Supported values are arrays, lists and tuples of arrays and json serializable objects.
+    """
+    def __init__(self, root, version=ANALYSIS_VERSION):
+        self.root = root
+        self.version = version
+
+    def map_folder(self, map_hash):
+        return join(self.root, str(map_hash), 'v{}'.format(self.version))
+
+    @staticmethod
+    def key_name(key):
+        if isinstance(key, tuple):
+            return '-'.join(str(k) for k in key)
+        return str(key)
+
+    @staticmethod
+    def _write(fname, writer):
+        "Writes through temporary file, so readers never see partial files"
+        tmp = '{}.{}.tmp'.format(fname, os.getpid())
+        with open(tmp, 'wb') as f:
+            writer(f)
+        os.replace(tmp, fname)
+
+    def _write_array(self, fname, value):
+        self._write(fname, lambda f: np.save(f, np.ascontiguousarray(value)))
+
+    def _write_json(self, fname, value):
+        self._write(fname, lambda f: f.write(json.dumps(value).encode()))
+
+    def load(self, map_hash, key):
+        "Returns (found, value)"
+        path = join(self.map_folder(map_hash), self.key_name(key))
+        if exists(path + '.npy'):
+            return True, np.load(path + '.npy', mmap_mode='r')
+        if exists(path + '.seq.json'):
+            with open(path + '.seq.json') as f:
+                seq = json.load(f)
+            items = [np.load('{}.{}.npy'.format(path, i), mmap_mode='r') for i in range(seq['count'])]
+            return True, tuple(items) if seq['type'] == 'tuple' else items
+        if exists(path + '.json'):
+            with open(path + '.json') as f:
+                return True, json.load(f)
+        return False, None
+
+    def save(self, map_hash, key, value):
+        folder = self.map_folder(map_hash)
+        if not exists(folder):
+            os.makedirs(folder, exist_ok=True)
+            self._drop_other_versions(map_hash)
+        path = join(folder, self.key_name(key))
+        if isinstance(value, np.ndarray):
+            self._write_array(path + '.npy', value)
+        elif isinstance(value, (tuple, list)) and value and all(isinstance(v, np.ndarray) for v in value):
+            for i, v in enumerate(value):
+                self._write_array('{}.{}.npy'.format(path, i), v)
+            # written last, marks sequence as complete
+            self._write_json(path + '.seq.json', {
+                'type': 'tuple' if isinstance(value, tuple) else 'list',
+                'count': len(value),
+            })
+        else:
+            self._write_json(path + '.json', value)
+
+    def _drop_other_versions(self, map_hash):
+        current = 'v{}'.format(self.version)
+        map_root = join(self.root, str(map_hash))
+        for name in os.listdir(map_root):
+            if name != current:
+                shutil.rmtree(join(map_root, name), ignore_errors=True)
+
+    def clear(self, map_hash=None):
+        "Removes cached files of the map, or of all maps if map_hash is None"
+        path = self.root if map_hash is None else join(self.root, str(map_hash))
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class AnalysisCache:
+    """
+    In-memory storage of map analysis products grouped by map hash.
+    Least recently used maps are evicted when there are more than max_maps maps
+    or arrays take more than max_bytes (the map in use is never evicted).
+    Cached arrays are made read-only, copy them before modification.
+    Optional disk (DiskCache) is checked on memory misses and stores computed values.
+    """
+    def __init__(self, max_maps=4, max_bytes=None, disk=None):
+        self.max_maps = max_maps
+        self.max_bytes = max_bytes
+        self.disk = disk
+        self.maps = OrderedDict()
+
+    @staticmethod
+    def _nbytes(value):
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        if isinstance(value, (tuple, list)):
+            return sum(AnalysisCache._nbytes(v) for v in value)
+        return 0
+
+    @staticmethod
+    def _freeze(value):
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+        elif isinstance(value, (tuple, list)):
+            for v in value:
+                AnalysisCache._freeze(v)
+
+    def total_bytes(self):
+        return sum(self._nbytes(v) for entries in self.maps.values() for v in entries.values())
+
+    def _over_limit(self):
+        if len(self.maps) > self.max_maps:
+            return True
+        return self.max_bytes is not None and self.total_bytes() > self.max_bytes
+
+    def _evict(self):
+        while len(self.maps) > 1 and self._over_limit():
+            self.maps.popitem(last=False)
+
+    def _load_or_compute(self, map_hash, key, compute, persistent):
+        if self.disk is None or not persistent:
+            return compute()
+        found, value = self.disk.load(map_hash, key)
+        if not found:
+            value = compute()
+            self.disk.save(map_hash, key, value)
+        return value
+
+    def get(self, map_hash, key, compute, persistent=True):
+        """
+        Returns cached value, compute() is called if there is no such value yet.
+        Not persistent values are never stored on disk.
+        """
+        entries = self.maps.setdefault(map_hash, {})
+        self.maps.move_to_end(map_hash)
+        if key not in entries:
+            value = self._load_or_compute(map_hash, key, compute, persistent)
+            self._freeze(value)
+            entries[key] = value
+            self._evict()
+        return entries[key]
+
+    def invalidate(self, map_hash=None, key=None):
+        """
+        Drops cached values from memory (disk is not affected, see DiskCache.clear).
+        No map_hash means all maps, no key means all values of the map.
+        """
+        hashes = list(self.maps) if map_hash is None else [map_hash]
+        for h in hashes:
+            if h not in self.maps:
+                continue
+            if key is None:
+                del self.maps[h]
+            else:
+                self.maps[h].pop(key, None)
+
+
+ANALYSIS_CACHE = AnalysisCache()
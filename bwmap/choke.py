@@ -1,9 +1,14 @@
-from functools import lru_cache
+from math import ceil
+from heapq import heappush, heappop, heapify
 from collections import defaultdict
+from typing import NamedTuple, Tuple, List, Dict
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
 from .metrics import MapMetrics
+from .regions import RegionMap, label_regions
+from .parallel import AnalysisPool, attach
 
 
 def step_off(data: np.ndarray):
@@ -11,6 +16,13 @@ def step_off(data: np.ndarray):
 
 
 def build_quadtree_levels(data: np.ndarray):
+    """
+    Levels of quadtree from 1x1 root to data, True cell is a fully True block.
+    Data is padded with False up to square with power of 2 side.
+    """
+    side = 1 << max(int(max(data.shape)) - 1, 0).bit_length()
+    if data.shape != (side, side):
+        data = np.pad(data, ((0, side - data.shape[0]), (0, side - data.shape[1])))
     levels = [data]
     while min(*data.shape) > 1:
         data = step_off(data)
@@ -18,28 +30,381 @@ def build_quadtree_levels(data: np.ndarray):
     return list(reversed(levels))
 
 
+def morton_order(xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    """
+    Indices sorting points in depth-first quadtree order
+    (children of a node go as top-left, bottom-left, top-right, bottom-right)
+    """
+    xs, ys = xs.astype(np.int64), ys.astype(np.int64)
+    bits = int(max(xs.max(initial=0), ys.max(initial=0))).bit_length()
+    key = np.zeros(len(xs), dtype=np.int64)
+    for b in range(bits - 1, -1, -1):
+        key = key * 4 + ((xs >> b) & 1) * 2 + ((ys >> b) & 1)
+    return np.argsort(key, kind='stable')
+
+
+def quadtree_leaves(levels) -> np.ndarray:
+    """
+    Maximal full blocks of quadtree: full at their level, but not at parent one.
+    Returns (N, 4) int32 array of (x, y, w, h) in depth-first order.
+    """
+    parts = []
+    for level, full in enumerate(levels):
+        leaf = full
+        if level > 0:
+            parent = levels[level - 1]
+            leaf = full & ~np.repeat(np.repeat(parent, 2, axis=0), 2, axis=1)
+        ys, xs = np.nonzero(leaf)
+        sz = 2 ** (len(levels) - level - 1)
+        parts.append(np.stack((xs * sz, ys * sz, np.full_like(xs, sz), np.full_like(xs, sz)), axis=1))
+    leaves = np.concatenate(parts).astype(np.int32).reshape(-1, 4)
+    return leaves[morton_order(leaves[:, 0], leaves[:, 1])]
+
+
+def window_reduce(data: np.ndarray, radius: int, func, fill) -> np.ndarray:
+    """
+    Reduces [2 * radius + 1] square window around every cell with func (np.min / np.max),
+    cells out of array are fill. Separable, rows then columns.
+    """
+    size = 2 * radius + 1
+    padded = np.pad(data, radius, mode='constant', constant_values=fill)
+    rows = func(sliding_window_view(padded, size, axis=1), axis=-1)
+    return func(sliding_window_view(rows, size, axis=0), axis=-1)
+
+
+def ridge_mask(walldist: np.ndarray) -> np.ndarray:
+    """
+    Medial axis of walkable space: cells, where distance to walls is a strict local maximum
+    across at least one of 4 directions (straight and diagonal).
+    """
+    d = np.pad(walldist, 1, mode='edge')
+    center = d[1:-1, 1:-1]
+    rows, cols = walldist.shape
+    result = np.zeros(walldist.shape, dtype=np.bool_)
+    for dx, dy in ((1, 0), (0, 1), (1, 1), (1, -1)):
+        a = d[1 + dy:1 + dy + rows, 1 + dx:1 + dx + cols]
+        b = d[1 - dy:1 - dy + rows, 1 - dx:1 - dx + cols]
+        result |= (center >= a) & (center >= b) & ((center > a) | (center > b))
+    return result & (walldist > 0)
+
+
+def line_cells(x1: int, y1: int, x2: int, y2: int) -> List[Tuple[int, int]]:
+    "4-connected digital line, it blocks 8-connected moves across it"
+    cells = [(x1, y1)]
+    dx, dy = abs(x2 - x1), -abs(y2 - y1)
+    sx, sy = (1 if x2 > x1 else -1), (1 if y2 > y1 else -1)
+    x, y, err = x1, y1, dx + dy
+    while (x, y) != (x2, y2):
+        e2 = 2 * err
+        if e2 - dy > dx - e2:
+            err += dy
+            x += sx
+        else:
+            err += dx
+            y += sy
+        cells.append((x, y))
+    return cells
+
+
+class Choke(NamedTuple):
+    x: int
+    y: int
+    width: float
+    # wall cells at both sides of choke line
+    ends: Tuple[Tuple[int, int], Tuple[int, int]]
+    # ids of separated regions
+    regions: Tuple[int, int]
+
+
+class ChokeLine(NamedTuple):
+    "Choke of ChokeDetector before regions are merged"
+    center: Tuple[int, int]
+    ends: Tuple[Tuple[int, int], Tuple[int, int]]
+    cells: List[Tuple[int, int]]
+    # ids of fine regions at both sides
+    regions: Tuple[int, int]
+    width: float
+
+
+class ChokeAnalysis(NamedTuple):
+    regions: RegionMap
+    chokes: List[Choke]
+    # region id -> [(neighbour region id, choke index)]
+    graph: Dict[int, List[Tuple[int, int]]]
+
+
+def choke_analysis_to_json(analysis: ChokeAnalysis):
+    "Makes json serializable structure from ChokeAnalysis, region labels matrix is left out"
+    regions = analysis.regions
+    return {
+        'regions': [
+            {
+                'id': rid,
+                'area': int(regions.areas[rid]),
+                'bbox': [int(v) for v in regions.bboxes[rid]],
+                'centroid': [float(v) for v in regions.centroids[rid]],
+            }
+            for rid in range(1, regions.count + 1)
+        ],
+        'chokes': [
+            {
+                'x': int(choke.x),
+                'y': int(choke.y),
+                'width': float(choke.width),
+                'ends': [[int(v) for v in end] for end in choke.ends],
+                'regions': [int(r) for r in choke.regions],
+            }
+            for choke in analysis.chokes
+        ],
+        'graph': {
+            str(rid): [[int(nb), int(ci)] for nb, ci in edges]
+            for rid, edges in analysis.graph.items()
+        },
+    }
+
+
+class ChokeDetector:
+    """
+    Splits walkable space into regions at chokepoints (walk tiles):
+        - ridge (medial axis) of wall distance field is extracted
+        - ridge cells with minimal clearance around CHOKE_RADIUS, which have
+          at least WIDENING times wider ridge in WIDE_RADIUS are choke candidates,
+          every connected group of candidates gives one choke
+        - choke line goes through the choke cell between two nearest walls
+          on opposite sides, walkable space is cut by choke lines into regions
+        - regions of a choke are the ones with most contact on each side of its line,
+          the line must separate them in its surroundings (see _separates)
+        - chokes, which don't separate regions or leave regions smaller
+          than MIN_REGION_AREA, are dropped and regions are labelled again,
+          only the narrowest choke is kept between two regions
+    """
+    CHOKE_RADIUS = 6
+    WIDE_RADIUS = 16
+    WIDENING = 1.5
+    MIN_REGION_AREA = 400
+    MAX_ROUNDS = 8
+
+    def __init__(self, walkable: np.ndarray, walldist: np.ndarray):
+        self.walkable = walkable
+        self.walldist = walldist
+
+    def find_candidates(self) -> List[Tuple[int, int]]:
+        d = self.walldist
+        ridge = ridge_mask(d) & self.walkable
+        lowest = window_reduce(np.where(ridge, d, np.inf), self.CHOKE_RADIUS, np.min, np.inf)
+        widest = window_reduce(np.where(ridge, d, -np.inf), self.WIDE_RADIUS, np.max, -np.inf)
+        candidates = ridge & (d <= lowest) & (d * self.WIDENING <= widest)
+
+        labels, count = label_regions(candidates)
+        if not count:
+            return []
+        ys, xs = np.nonzero(labels)
+        groups = labels[ys, xs]
+        # middle cell of each group
+        order = np.lexsort((xs, ys, groups))
+        bounds = np.searchsorted(groups[order], np.arange(1, count + 2))
+        middle = order[(bounds[:-1] + bounds[1:]) // 2]
+        return list(zip(xs[middle].tolist(), ys[middle].tolist()))
+
+    def _nearest_wall(self, x, y, radius, direction=None):
+        rows, cols = self.walkable.shape
+        x0, y0 = max(x - radius, 0), max(y - radius, 0)
+        window = ~self.walkable[y0:y + radius + 1, x0:x + radius + 1]
+        wy, wx = np.nonzero(window)
+        wx, wy = wx + x0 - x, wy + y0 - y
+        if direction is not None:
+            opposite = wx * direction[0] + wy * direction[1] < 0
+            wx, wy = wx[opposite], wy[opposite]
+        if not len(wx):
+            return None
+        i = np.argmin(wx * wx + wy * wy)
+        return int(x + wx[i]), int(y + wy[i])
+
+    def choke_line(self, x, y):
+        "Ends of choke line through (x, y) or None"
+        radius = int(ceil(self.walldist[y, x])) + 1
+        end1 = self._nearest_wall(x, y, radius)
+        if end1 is None:
+            return None
+        end2 = self._nearest_wall(x, y, 2 * radius + 1, (end1[0] - x, end1[1] - y))
+        if end2 is None:
+            return None
+        return end1, end2
+
+    def _sides(self, labels, ends, cells):
+        """
+        Regions at both sides of choke line: the one with most contact on each side.
+        None if the sides have the same region, or are connected around the line (see _separates)
+        """
+        (x1, y1), (x2, y2) = ends
+        rows, cols = labels.shape
+        line = set(cells)
+        contact = (defaultdict(int), defaultdict(int))
+        near = ([], [])
+        for x, y in cells:
+            for ny in range(max(y - 1, 0), min(y + 2, rows)):
+                for nx in range(max(x - 1, 0), min(x + 2, cols)):
+                    # side by sign of cross product with line direction
+                    side = (x2 - x1) * (ny - y1) - (y2 - y1) * (nx - x1)
+                    if not side or (nx, ny) in line or not self.walkable[ny, nx]:
+                        continue
+                    near[side > 0].append((nx, ny))
+                    if labels[ny, nx]:
+                        contact[side > 0][int(labels[ny, nx])] += 1
+        if not contact[0] or not contact[1]:
+            return None
+        a, b = (max(c, key=c.get) for c in contact)
+        if a == b or not self._separates(cells, *near):
+            return None
+        return a, b
+
+    def _separates(self, cells, near1, near2) -> bool:
+        """
+        Walkable cells near1 and near2 are in different components, when only choke line cells
+        are cut, within window of CHOKE_RADIUS around the line
+        """
+        rows, cols = self.walkable.shape
+        xs, ys = (np.array(v) for v in zip(*cells))
+        x0, y0 = max(int(xs.min()) - self.CHOKE_RADIUS, 0), max(int(ys.min()) - self.CHOKE_RADIUS, 0)
+        x1, y1 = min(int(xs.max()) + self.CHOKE_RADIUS + 1, cols), min(int(ys.max()) + self.CHOKE_RADIUS + 1, rows)
+        window = self.walkable[y0:y1, x0:x1].copy()
+        window[ys - y0, xs - x0] = False
+        labels, _ = label_regions(window)
+        side1 = {int(labels[y - y0, x - x0]) for x, y in near1}
+        side2 = {int(labels[y - y0, x - x0]) for x, y in near2}
+        return not side1 & side2
+
+    def _fill_cut(self, labels, cut):
+        "Gives walkable cells of choke lines labels of neighbour regions"
+        todo = cut & self.walkable
+        while todo.any():
+            padded = np.pad(labels, 1)
+            neighbours = np.max([
+                padded[1 + dy:1 + dy + labels.shape[0], 1 + dx:1 + dx + labels.shape[1]]
+                for dy in (-1, 0, 1) for dx in (-1, 0, 1)
+            ], axis=0)
+            fill = todo & (neighbours > 0)
+            if not fill.any():
+                break
+            labels[fill] = neighbours[fill]
+            todo &= ~fill
+
+    def _merge_regions(self, areas, chokes: List[ChokeLine]):
+        """
+        Drops chokes which don't separate regions, all but the narrowest choke
+        of every pair of regions, and the widest choke of every region smaller than MIN_REGION_AREA,
+        until nothing changes. Regions of dropped chokes are merged.
+        Returns kept chokes and region of every fine region
+        """
+        parent = list(range(len(areas)))
+
+        def root(r):
+            while parent[r] != r:
+                parent[r] = parent[parent[r]]
+                r = parent[r]
+            return r
+
+        area = {r: int(a) for r, a in enumerate(areas)}
+        while True:
+            kept, dropped = {}, False
+            for choke in chokes:
+                pair = tuple(sorted(map(root, choke.regions)))
+                if pair[0] == pair[1]:
+                    dropped = True
+                elif pair not in kept or choke.width < kept[pair].width:
+                    kept[pair] = choke
+            chokes = list(kept.values())
+
+            widest = {}
+            for i, choke in enumerate(chokes):
+                for r in map(root, choke.regions):
+                    if area[r] < self.MIN_REGION_AREA and (r not in widest or choke.width > chokes[widest[r]].width):
+                        widest[r] = i
+            for i in set(widest.values()):
+                a, b = map(root, chokes[i].regions)
+                if a != b:
+                    parent[b] = a
+                    area[a] += area[b]
+                    dropped = True
+            if not dropped:
+                return chokes, [root(r) for r in range(len(areas))]
+
+    def __call__(self) -> ChokeAnalysis:
+        lines, seen = [], set()
+        for x, y in self.find_candidates():
+            ends = self.choke_line(x, y)
+            # candidates of one choke may find the same walls in either order
+            if ends is not None and frozenset(ends) not in seen:
+                seen.add(frozenset(ends))
+                lines.append(((x, y), ends, line_cells(*ends[0], *ends[1])))
+
+        cut = np.zeros(self.walkable.shape, dtype=np.bool_)
+        for _, _, cells in lines:
+            xs, ys = zip(*cells)
+            cut[ys, xs] = True
+        labels, count = label_regions(self.walkable & ~cut)
+        areas = np.bincount(labels.ravel(), minlength=count + 1)
+        areas[0] = 0
+
+        chokes = []
+        for center, ends, cells in lines:
+            sides = self._sides(labels, ends, cells)
+            if sides is not None:
+                width = float(np.hypot(ends[0][0] - ends[1][0], ends[0][1] - ends[1][1]))
+                chokes.append(ChokeLine(center, ends, cells, sides, width))
+        chokes, roots = self._merge_regions(areas, chokes)
+
+        # number merged regions from 1 again
+        _, renumber = np.unique(roots, return_inverse=True)
+        labels = renumber.astype(np.int32)[labels]
+        self._fill_cut(labels, cut)
+
+        result, graph = [], defaultdict(list)
+        for choke in chokes:
+            a, b = sorted(int(renumber[r]) for r in choke.regions)
+            graph[a].append((b, len(result)))
+            graph[b].append((a, len(result)))
+            result.append(Choke(*choke.center, choke.width, choke.ends, (a, b)))
+        return ChokeAnalysis(RegionMap(labels, int(labels.max())), result, dict(graph))
+
+
+def detect_chokes(walkable, walldist) -> ChokeAnalysis:
+    "ChokeDetector run, arrays may be shared (see AnalysisPool.share)"
+    return ChokeDetector(attach(walkable), attach(walldist))()
+
+
 class ChokeFinder:
-    def __init__(self, game, mm: MapMetrics):
+    """
+    pool runs choke detection in a worker (see AnalysisPool), serial by default
+    """
+    def __init__(self, game, mm: MapMetrics, pool: AnalysisPool=None):
         self.game = game
         self.mm = mm
+        self.pool = AnalysisPool(1) if pool is None else pool
+
+    def submit(self):
+        "Starts choke detection, returns future of ChokeAnalysis"
+        self.levels = self.mm.get_quadtree_levels()
+        return self.pool.submit(
+            detect_chokes,
+            self.pool.share(self.mm.get_walkability_map()),
+            self.pool.share(self.mm.get_wall_distances()),
+        )
 
     def __call__(self):
-        self.levels = build_quadtree_levels(self.mm.get_walkability_map())
+        self.analysis = self.submit().result()
+        return self.analysis
 
-    @lru_cache(100)
     def node_size(self, level):
         return 2 ** (len(self.levels) - level - 1)
 
-    def iter_nodes(self, level=0, x=0, y=0):
-        if self.levels[level][y, x]:
-            sz = self.node_size(level)
-            yield x * sz, y * sz, sz, sz
-        else:
-            if level + 1 >= len(self.levels):
-                return
-            for dx in (0, 1):
-                for dy in (0, 1):
-                    yield from self.iter_nodes(level + 1, x * 2 + dx, y * 2 + dy)
+    def leaves(self):
+        "Quadtree leaves as (N, 4) int32 array of (x, y, w, h), input format of node mergers"
+        return self.mm.cached('quadtree_leaves', lambda: quadtree_leaves(self.levels))
+
+    def iter_nodes(self):
+        for x, y, w, h in self.leaves().tolist():
+            yield x, y, w, h
 
 
 class BaseNodeMerger:
@@ -47,7 +412,13 @@ class BaseNodeMerger:
     EMPTY_ID = 1
 
     def __init__(self, nodelist):
-        self.nodes = {i: node for i, node in enumerate(nodelist, start=2)}
+        """
+        nodelist is (N, 4) array (see ChokeFinder.leaves) or iterable of (x, y, w, h)
+        """
+        if not isinstance(nodelist, np.ndarray):
+            nodelist = list(nodelist)
+        nodelist = np.asarray(nodelist, dtype=np.int32).reshape(-1, 4).tolist()
+        self.nodes = {i: tuple(node) for i, node in enumerate(nodelist, start=2)}
         self._prepare()
 
     def _prepare(self):
@@ -61,104 +432,195 @@ class BaseNodeMerger:
 
 
 class SameSideNodeMerger(BaseNodeMerger):
-    @staticmethod
-    def _node_sides(node):
-        x, y, szx, szy = node
-        # True vertical, False horizontal
+    """
+    Merges pairs of nodes sharing a whole side, longest sides first.
+    Sides are int keys (see _side_keys), merged node gets its new keys
+    by adding sizes to the old ones, rectangles array indexed by node id is
+    filled from the keys when merging is done.
+    Every merge step handles sides shared by exactly 2 nodes in order of their
+    first appearance, from a heap of sides which became shared since the previous step
+    (touched), sides shorter than the current size wait in buckets by their size.
+    progress(side_size, merged_count) is called after every merge step.
+    """
+    # bits per coordinate in side key
+    KEY_BITS = 16
+
+    def __init__(self, nodelist, progress=None):
+        self.progress = progress
+        super().__init__(nodelist)
+
+    @classmethod
+    def _side_keys(cls, x, y, szx, szy):
+        """
+        Int keys of 4 sides of rectangle, (vertical, x, y, size) packed into KEY_BITS each.
+        Works for python ints and int64 arrays of rectangles alike
+        """
+        # vertical or horizontal
         # +- 0 -+
         # 3     1
         # +- 2 -+
-        yield 0, (False, x, y, szx)
-        yield 1, (True, x + szx, y, szy)
-        yield 2, (False, x, y + szy, szx)
-        yield 3, (True, x, y, szy)
+        b = cls.KEY_BITS
+        sides = (
+            (0, x, y, szx),
+            (1, x + szx, y, szy),
+            (0, x, y + szy, szx),
+            (1, x, y, szy),
+        )
+        return [(((v << b | sx) << b | sy) << b) | size for v, sx, sy, size in sides]
 
-    def _push_node_sides(self, nid, node):
-        for side, key in self._node_sides(node):
-            self.side_index[key].add((nid, side))
+    def _push_side(self, entry, key):
+        entries = self.side_index.get(key, ()) + (entry,)
+        if len(entries) == 1:
+            self.key_order.setdefault(key, len(self.key_order))
+        else:
+            self.touched.add(key)
+        self.side_index[key] = entries
 
-    def _pop_node_sides(self, nid, node):
-        for side, key in self._node_sides(node):
-            self.side_index[key].remove((nid, side))
+    def _pop_side(self, entry, key):
+        entries = self.side_index[key]
+        if len(entries) == 1:
+            del self.side_index[key]
+        else:
+            self.side_index[key] = entries[:1] if entries[1] == entry else entries[1:]
 
     def _prepare(self):
-        self.side_index = defaultdict(lambda: set())
-        for i, node in self.nodes.items():
-            self._push_node_sides(i, node)
-
-    def _grow_down(self, key, id1, side1, id2, side2):
-        assert side1 == 2
-        assert side2 == 0
-
-        node2 = self.nodes.pop(id2)
-        self._pop_node_sides(id2, node2)
-        self._pop_node_sides(id1, self.nodes[id1])
-        x, y, szx, szy = self.nodes[id1]
-        self.nodes[id1] = x, y, szx, szy + node2[3]
-        self._push_node_sides(id1, self.nodes[id1])
-
-    def _grow_right(self, key, id1, side1, id2, side2):
-        assert side1 == 1
-        assert side2 == 3
-
-        node2 = self.nodes.pop(id2)
-        self._pop_node_sides(id2, node2)
-        self._pop_node_sides(id1, self.nodes[id1])
-        x, y, szx, szy = self.nodes[id1]
-        self.nodes[id1] = x, y, szx + node2[2], szy
-        self._push_node_sides(id1, self.nodes[id1])
+        count = max(self.nodes, default=1) + 1
+        self.rects = np.zeros((count, 4), dtype=np.int32)
+        self.alive = np.zeros(count, dtype=np.bool_)
+        ids = np.array(list(self.nodes), dtype=np.int64)
+        if len(ids):
+            self.rects[ids] = [self.nodes[i] for i in ids.tolist()]
+            self.alive[ids] = True
+        keys = np.stack(self._side_keys(*self.rects[ids].astype(np.int64).T), axis=1).reshape(-1, 4)
+
+        # python ints of side keys of alive nodes
+        self.side_keys = [None] * count
+        for i, node_keys in zip(ids.tolist(), keys.tolist()):
+            self.side_keys[i] = node_keys
+
+        # key -> tuple of entries (node id << 2 | side), a side is shared by 2 nodes at most
+        flat = keys.ravel()
+        order = np.argsort(flat, kind='stable')
+        unique, first, counts = np.unique(flat, return_index=True, return_counts=True)
+        assert counts.max(initial=0) <= 2
+        starts = np.cumsum(counts) - counts
+        entries = (np.repeat(ids, 4) << 2 | np.tile(np.arange(4), len(ids)))[order]
+        single, pair = counts == 1, counts == 2
+        self.side_index = dict(zip(unique[single].tolist(), zip(entries[starts[single]].tolist())))
+        self.side_index.update(zip(unique[pair].tolist(), zip(
+            entries[starts[pair]].tolist(),
+            entries[starts[pair] + 1].tolist(),
+        )))
+        self.key_order = dict(zip(unique[np.argsort(first, kind='stable')].tolist(), range(len(unique))))
+        # keys shared by 2 nodes since the last step,
+        # and side size -> keys left for smaller side sizes
+        self.touched = set(unique[pair].tolist())
+        self.waiting = defaultdict(list)
 
     def _merge_side(self, key):
-        if len(self.side_index[key]) != 2:
+        entries = self.side_index.get(key)
+        if entries is None or len(entries) != 2:
             return False
-        (id1, side1), (id2, side2) = self.side_index[key]
-        if side1 == 0:
-            self._grow_down(key, id2, side2, id1, side1)
-        elif side1 == 1:
-            self._grow_right(key, id1, side1, id2, side2)
-        elif side1 == 2:
-            self._grow_down(key, id1, side1, id2, side2)
-        else:
-            self._grow_right(key, id2, side2, id1, side1)
+        # top or left node grows over the other one
+        entry1, entry2 = entries
+        if entry1 & 3 in (0, 3):
+            entry1, entry2 = entry2, entry1
+        id1, side1, id2 = entry1 >> 2, entry1 & 3, entry2 >> 2
+        del self.side_index[key]
+        keys1, keys2 = self.side_keys[id1], self.side_keys[id2]
+        size_mask = (1 << self.KEY_BITS) - 1
+
+        # the far side of id2 goes to id1, sides across the merged one grow by sizes of id2 ones
+        grown = list(keys1)
+        far = grown[side1] = keys2[side1]
+        moved = id2 << 2 | side1
+        self.side_index[far] = tuple(id1 << 2 | side1 if entry == moved else entry for entry in self.side_index[far])
+        across = (1, 3) if side1 == 2 else (0, 2)
+        for side in across:
+            self._pop_side(id1 << 2 | side, keys1[side])
+            self._pop_side(id2 << 2 | side, keys2[side])
+            grown[side] = keys1[side] + (keys2[side] & size_mask)
+        for side in across:
+            self._push_side(id1 << 2 | side, grown[side])
+        self.side_keys[id1] = grown
+        self.side_keys[id2] = None
+        self.alive[id2] = False
         return True
 
     def _merge_step(self, min_side_size):
-        keys = []
-        for key, ids in self.side_index.items():
-            assert len(ids) in (0, 1, 2)
-            if len(ids) == 2 and key[3] >= min_side_size:
-                keys.append(key)
-
+        size_mask = (1 << self.KEY_BITS) - 1
+        queue = []
+        for key in self.touched:
+            if len(self.side_index.get(key, ())) != 2:
+                continue
+            if key & size_mask >= min_side_size:
+                queue.append((self.key_order[key], key))
+            else:
+                self.waiting[key & size_mask].append(key)
+        self.touched = set()
+        heapify(queue)
         count = 0
-        for key in keys:
-            if self._merge_side(key):
+        while queue:
+            if self._merge_side(heappop(queue)[1]):
                 count += 1
         return count
 
     def _max_node_size(self):
-        result = 0
-        for x, y, sx, sy in self.nodes.values():
-            result = max(result, sx, sy)
-        return result
+        return int(self.rects[self.alive, 2:].max(initial=0))
 
     def __call__(self):
         sz = self._max_node_size()
         while sz >= 1:
+            # sides too small for the previous size
+            for size in [size for size in self.waiting if size >= sz]:
+                self.touched.update(self.waiting.pop(size))
             while True:
                 count = self._merge_step(sz)
-                print(sz, count)
+                if self.progress is not None:
+                    self.progress(sz, count)
                 if count == 0:
                     break
             sz //= 2
+        # rectangles from top and left side keys, (vertical, x, y, size)
+        ids = np.flatnonzero(self.alive)
+        keys = np.array([self.side_keys[i] for i in ids.tolist()], dtype=np.int64).reshape(-1, 4)
+        b, size_mask = self.KEY_BITS, (1 << self.KEY_BITS) - 1
+        self.rects[ids] = np.stack((
+            keys[:, 0] >> 2 * b & size_mask,
+            keys[:, 0] >> b & size_mask,
+            keys[:, 0] & size_mask,
+            keys[:, 3] & size_mask,
+        ), axis=1)
+        self.nodes = {i: tuple(rect) for i, rect in zip(ids.tolist(), self.rects[ids].tolist())}
 
 
 class GrowthNodeMerger(BaseNodeMerger):
-    def _place_node(self, nid, check=True):
+    """
+    Grows nodes one by one, greatest area first, over their neighbours,
+    which are cut or split to give way.
+    Areas are ordered by max-heap with lazy deletion: entries of removed or worked
+    nodes are skipped when popped, ties go to the least (oldest) id.
+    Only grown nodes are pushed, entries of shrunk ones are pushed back with actual area when popped.
+    Map of node ids is updated only where cells change owner.
+    debug=True checks map consistency on every placement and overlapping of result nodes.
+    """
+    def __init__(self, nodelist, debug=False):
+        self.debug = debug
+        super().__init__(nodelist)
+
+    def _set_area(self, nid, area):
+        grown = area > self.areas.get(nid, 0)
+        self.areas[nid] = area
+        if grown:
+            heappush(self.heap, (-area, nid))
+
+    def _place_node(self, nid, under=None):
+        "under - id of cells expected under node, checked in debug mode"
         x, y, sx, sy = self.nodes[nid]
-        if check:
-            assert (self.map[y:y + sy, x:x + sx] == self.EMPTY_ID).all()
+        if self.debug and under is not None:
+            assert (self.map[y:y + sy, x:x + sx] == under).all()
         self.map[y:y + sy, x:x + sx] = nid
-        self.areas[nid] = sx * sy
+        self._set_area(nid, sx * sy)
 
     def _prepare(self):
         mx, my = 0, 0
@@ -167,10 +629,11 @@ class GrowthNodeMerger(BaseNodeMerger):
             my = max(my, y + sy)
         self.mx, self.my = mx, my
 
-        self.map = np.full((my, mx), self.WALL_ID, dtype=np.int_)
+        self.map = np.full((my, mx), self.WALL_ID, dtype=np.int32)
         self.areas = {}
+        self.heap = []
         for nid in self.nodes.keys():
-            self._place_node(nid, check=False)
+            self._place_node(nid)
 
         self.new_id = len(self.nodes) + 5
 
@@ -196,7 +659,9 @@ class GrowthNodeMerger(BaseNodeMerger):
         assert x <= splitx <= x + sx, '{} < {} < {}'.format(x, splitx, x + sx)
         assert y <= splity <= y + sy
 
-        self._remove_node(nid)
+        # quadrants overwrite node cells, no need to clear them first
+        del self.nodes[nid]
+        del self.areas[nid]
         ids = [self._allocate_id() for _ in range(4)]
 
         s1x, s1y = splitx - x, splity - y
@@ -209,7 +674,7 @@ class GrowthNodeMerger(BaseNodeMerger):
         self.nodes[ids[3]] = x, splity, s1x, s2y
 
         for i in ids:
-            self._place_node(i)
+            self._place_node(i, under=nid)
         return ids
 
     def _cleanup_empty_nodes(self, ids):
@@ -220,17 +685,23 @@ class GrowthNodeMerger(BaseNodeMerger):
                 self._remove_node(i)
 
     def _cut_node(self, nid, side, amount):
-        self._clear_node_map(nid)
         x, y, sx, sy = self.nodes[nid]
 
         if amount >= sy if side in (0, 2) else amount >= sx:
             self._remove_node(nid)
             return
 
+        # only cut off cells are cleared, the rest keeps node id
         if side == 0:
+            self.map[y:y + amount, x:x + sx] = self.EMPTY_ID
             y += amount
+        elif side == 2:
+            self.map[y + sy - amount:y + sy, x:x + sx] = self.EMPTY_ID
         elif side == 3:
+            self.map[y:y + sy, x:x + amount] = self.EMPTY_ID
             x += amount
+        else:
+            self.map[y:y + sy, x + sx - amount:x + sx] = self.EMPTY_ID
 
         if side in (0, 2):
             sy -= amount
@@ -238,7 +709,7 @@ class GrowthNodeMerger(BaseNodeMerger):
             sx -= amount
 
         self.nodes[nid] = x, y, sx, sy
-        self._place_node(nid)
+        self._set_area(nid, sx * sy)
 
     @staticmethod
     def _is_range_in(a1, b1, a2, b2):
@@ -299,14 +770,13 @@ class GrowthNodeMerger(BaseNodeMerger):
         node = self.nodes[nid]
         if not self._PRECHECK[side](*node, self.mx, self.my):
             return False
-        map_chunk = self.map[self._SLICES[side](*node)]
-        if (map_chunk == self.WALL_ID).any():
+        strip = self._SLICES[side](*node)
+        affected_ids = set(self.map[strip].ravel().tolist())
+        if self.WALL_ID in affected_ids:
             return False
 
-        self._clear_node_map(nid)
-        affected_ids = np.unique(map_chunk)
         vert = side % 2
-        for i in affected_ids:
+        for i in sorted(affected_ids):
             target = self.nodes[i]
             smode = self._get_split_side(
                 side,
@@ -328,8 +798,12 @@ class GrowthNodeMerger(BaseNodeMerger):
                 self._cut_node(ids[(side + 2) % 4], (side + 3) % 4, node[2 + vert])
                 self._cleanup_empty_nodes(ids)
 
-        self.nodes[nid] = self._AFTER[side](*node)
-        self._place_node(nid)
+        # neighbours gave way on the strip, node cells are not changed
+        if self.debug:
+            assert (self.map[strip] == self.EMPTY_ID).all()
+        self.map[strip] = nid
+        x, y, sx, sy = self.nodes[nid] = self._AFTER[side](*node)
+        self._set_area(nid, sx * sy)
         return True
 
     def _grow_node(self, nid):
@@ -337,15 +811,16 @@ class GrowthNodeMerger(BaseNodeMerger):
             while self._grow_side(nid, side):
                 pass
 
-    def _find_max_area_chunk(self, worked):
-        max_area, result = 0, None
-        for i, area in self.areas.items():
-            if i in worked:
+    def _pop_max_area_chunk(self, worked):
+        while self.heap:
+            area, i = heappop(self.heap)
+            if i in worked or i not in self.areas:
                 continue
-            if area > max_area:
-                result = i
-                max_area = area
-        return result
+            if self.areas[i] == -area:
+                return i
+            if self.areas[i] > 0:
+                heappush(self.heap, (-self.areas[i], i))
+        return None
 
     def _rechecker(self):
         check_map = np.full((self.my, self.mx), self.WALL_ID, dtype=np.int_)
@@ -356,11 +831,12 @@ class GrowthNodeMerger(BaseNodeMerger):
     def __call__(self):
         worked = set()
         while True:
-            i = self._find_max_area_chunk(worked)
+            i = self._pop_max_area_chunk(worked)
             if i is None:
                 break
             self._grow_node(i)
             x, y, sx, sy = self.nodes[i]
             self.map[y:y + sy, x:x + sx] = self.WALL_ID
             worked.add(i)
-        self._rechecker()
+        if self.debug:
+            self._rechecker()
@@ -0,0 +1,104 @@
+import json
+from hashlib import md5
+from typing import List, Tuple
+
+import numpy as np
+
+from .flood import flood_mask, trace_path
+from .choke import Choke, ChokeFinder
+from .resources import BaseFinder, BASE_SIZE, unit_tileset
+
+
+class DistanceTable:
+    """
+    Ground distances (walk tiles) between all pairs of nodes:
+    base locations and start locations as top-left build tiles of resource depot,
+    and chokes (see ChokeAnalysis) by their center walk tiles.
+    Distance between nodes is the shortest one between their depot areas (or choke centers).
+    One flood per node, shortest paths to the following nodes are traced right away
+    and kept as flat walk tile indices, a path back is the reverse one,
+    so paths between nodes are restored without flooding again.
+    Results are cached per map hash.
+    """
+    def __init__(self, finder: BaseFinder, nodes: List[Tuple[int, int]], chokes: List[Choke]=()):
+        self.finder = finder
+        self.mm = finder.mm
+        self.nodes = [tuple(int(v) for v in node) for node in nodes]
+        self.nodes += [self.choke_key(choke) for choke in chokes]
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        digest = md5(json.dumps(self.nodes).encode()).hexdigest()[:16]
+        self.distances, self.path_cells, self.path_offsets = self.mm.cached(
+            ('ground_distances', digest), self._compute)
+
+    @classmethod
+    def from_bases(cls, finder: BaseFinder, valid_bases=None, start_locations=None, chokes=None):
+        """
+        Nodes are base locations of BaseFinder result followed by start locations, which are not bases,
+        and chokes of ChokeFinder result
+        """
+        if valid_bases is None:
+            valid_bases = finder()
+        if start_locations is None:
+            start_locations = finder.game.getStartLocations()
+        if chokes is None:
+            chokes = ChokeFinder(finder.game, finder.mm, finder.pool)().chokes
+        nodes = [tuple(b) for b in valid_bases]
+        nodes += [tuple(s) for s in start_locations if tuple(s) not in valid_bases]
+        return cls(finder, nodes, chokes)
+
+    @staticmethod
+    def choke_key(choke: Choke):
+        "Node of choke, distance and path take it as well as the choke itself"
+        return 'choke', int(choke.x), int(choke.y)
+
+    def _node_index(self, node) -> int:
+        if isinstance(node, Choke):
+            return self.index[self.choke_key(node)]
+        return self.index[tuple(node)]
+
+    def node_tiles(self, node):
+        "Walk tiles of node depot area, or choke center"
+        if node[0] == 'choke':
+            return {node[1:]}
+        BWS = self.mm.BWS
+        return unit_tileset(node[0] * BWS, node[1] * BWS, BASE_SIZE[0] * BWS, BASE_SIZE[1] * BWS)
+
+    def _compute(self):
+        wallmask = self.finder.get_walkable_wall_mask()
+        width = wallmask.shape[1]
+        count = len(self.nodes)
+        # flat indices of node tiles
+        tiles = [np.array([y * width + x for x, y in sorted(self.node_tiles(node))]) for node in self.nodes]
+        distances = np.full((count, count), np.inf)
+        # path of nodes i <= j is path_cells[path_offsets[i * count + j]:path_offsets[i * count + j + 1]]
+        paths = []
+        for i, node in enumerate(self.nodes):
+            dist, parents = flood_mask(wallmask, self.node_tiles(node), with_parents=True)
+            for j in range(count):
+                area = dist.ravel()[tiles[j]]
+                nearest = int(np.argmin(area))
+                distances[i, j] = area[nearest]
+                if j < i or not np.isfinite(area[nearest]):
+                    paths.append(())
+                    continue
+                end_y, end_x = divmod(int(tiles[j][nearest]), width)
+                paths.append([y * width + x for x, y in trace_path(parents, end_x, end_y)])
+        path_offsets = np.zeros(count * count + 1, dtype=np.int64)
+        path_offsets[1:] = np.cumsum([len(path) for path in paths])
+        path_cells = np.fromiter((cell for path in paths for cell in path), dtype=np.int32, count=path_offsets[-1])
+        return distances, path_cells, path_offsets
+
+    def distance(self, a, b) -> float:
+        return float(self.distances[self._node_index(a), self._node_index(b)])
+
+    def path(self, a, b) -> List[Tuple[int, int]]:
+        """
+        Shortest path of walk tiles from depot area (or choke center) of node a
+        to the one of node b, empty if b is unreachable.
+        """
+        i, j = self._node_index(a), self._node_index(b)
+        pair = min(i, j) * len(self.nodes) + max(i, j)
+        cells = self.path_cells[self.path_offsets[pair]:self.path_offsets[pair + 1]]
+        ys, xs = np.divmod(cells, self.mm.get_map_shape()[1])
+        path = list(zip(xs.tolist(), ys.tolist()))
+        return path[::-1] if i > j else path
@@ -1,8 +1,13 @@
 from math import sqrt, inf
-from typing import Tuple, Set, Callable
+from typing import Tuple, Set, Callable, Union, Sequence, List
 from itertools import product
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .transform import chamfer_transform, euclidean_transform
+from .integral import fit_mask
+from .pyramid import block_reduce, upscale
 
 
 SQ2 = sqrt(2)
@@ -20,17 +25,236 @@ def next_points(start_points):
         yield x, y, x - 1, y - 1, SQ2
 
 
+# (dx, dy, cost) for every step of 8-connected flood
+STEPS = (
+    (1, 0, 1.0),
+    (-1, 0, 1.0),
+    (0, 1, 1.0),
+    (0, -1, 1.0),
+    (1, 1, SQ2),
+    (1, -1, SQ2),
+    (-1, 1, SQ2),
+    (-1, -1, SQ2),
+)
+
+
+def neighbour_offsets(width: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Flat index offsets and step costs of 8 neighbours
+    for row-major array with given row width.
+    """
+    offsets = np.array([dy * width + dx for dx, dy, _ in STEPS], dtype=np.int32)
+    costs = np.array([cost for _, _, cost in STEPS])
+    return offsets, costs
+
+
+def flood_flat(
+    walls: np.ndarray,
+    dist: np.ndarray,
+    starts: np.ndarray,
+    width: int,
+    max_distance: float=inf,
+    parents: np.ndarray=None
+):
+    """
+    Bucketed Dijkstra over flat arrays, dist is updated inplace.
+    walls must have a wall border, so neighbours of any reachable cell stay in range.
+    dist must be inf everywhere except starts.
+    Optional parents (int8, filled with -1) receive index of STEPS item,
+    which led to every reached cell.
+
+    Every round settles all pending cells closer than (minimal pending distance + 1).
+    Step cost is never less than 1, so these cells can't improve each other
+    and each cell is relaxed exactly once.
+    """
+    offsets, costs = neighbour_offsets(width)
+    pending = np.asarray(starts, dtype=np.int32)
+    while pending.size:
+        pending_dist = dist[pending]
+        selected = pending_dist < pending_dist.min() + 1.0
+        settled = np.unique(pending[selected])
+        pending = pending[~selected]
+
+        points = (settled[:, None] + offsets).ravel()
+        rates = (dist[settled][:, None] + costs).ravel()
+        better = (rates <= max_distance) & (rates < dist[points]) & ~walls[points]
+        points, rates = points[better], rates[better]
+        np.minimum.at(dist, points, rates)
+        if parents is not None:
+            steps = np.tile(np.arange(len(STEPS), dtype=np.int8), len(settled))[better]
+            won = rates == dist[points]
+            parents[points[won]] = steps[won]
+        pending = np.concatenate((pending, points))
+
+
+def flood_mask(
+    wallmask: np.ndarray,
+    start_points: Set[Tuple[int, int]],
+    max_distance: float=inf,
+    with_parents: bool=False
+):
+    """
+    Same as flood, but walls are given by boolean 2d np.array (wall is True)
+    with_parents=True returns (distances, parents), see trace_path
+    """
+    walls = np.pad(wallmask, 1, mode='constant', constant_values=True)
+    width = walls.shape[1]
+    dist = np.full(walls.shape, inf)
+    parents = np.full(walls.shape, -1, dtype=np.int8) if with_parents else None
+    starts = np.array([(y + 1) * width + x + 1 for x, y in start_points], dtype=np.int32)
+    dist.flat[starts] = 0
+    flood_flat(
+        walls.ravel(), dist.ravel(), starts, width, max_distance,
+        parents=None if parents is None else parents.ravel(),
+    )
+    dist = np.ascontiguousarray(dist[1:-1, 1:-1])
+    if with_parents:
+        return dist, np.ascontiguousarray(parents[1:-1, 1:-1])
+    return dist
+
+
+def trace_path(parents: np.ndarray, x: int, y: int) -> List[Tuple[int, int]]:
+    """
+    Path from flood start to (x, y) by parents produced with flood_mask,
+    list of (x, y) including both ends. (x, y) must be reached by flood.
+    """
+    path = [(x, y)]
+    while parents[y, x] >= 0:
+        dx, dy, _ = STEPS[parents[y, x]]
+        x, y = x - dx, y - dy
+        path.append((x, y))
+    path.reverse()
+    return path
+
+
+def batch_windows(
+    shape: Tuple[int, int],
+    sources: Sequence[Set[Tuple[int, int]]],
+    max_distance: float
+) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """
+    Layout of flood_batch windows for map shape:
+    origins [N, 2] of windows and their common size (h, w)
+    """
+    radius = int(min(max_distance, max(shape)))
+    boxes = np.array([
+        (min(x for x, _ in sp), min(y for _, y in sp), max(x for x, _ in sp), max(y for _, y in sp))
+        for sp in sources
+    ], dtype=np.int32).reshape(-1, 4)
+    origins = boxes[:, :2] - radius
+    h = (boxes[:, 3] - boxes[:, 1]).max(initial=0) + 1 + 2 * radius
+    w = (boxes[:, 2] - boxes[:, 0]).max(initial=0) + 1 + 2 * radius
+    return origins, (int(h), int(w))
+
+
+def flood_batch(
+    wallmask: np.ndarray,
+    sources: Sequence[Set[Tuple[int, int]]],
+    max_distance: float,
+    dtype=np.float64,
+    size: Tuple[int, int]=None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Floods every source tileset independently, all of them in one pass.
+    Each source gets its own window: the bounding box of the source grown by max_distance,
+    which is enough because flood distance is never less than chebyshev distance.
+    Windows of all sources have the same size, cells out of map are walls.
+    dtype is the type of returned distances, np.float32 halves the memory.
+    size (h, w) overrides windows size, it must be not less than the one of batch_windows
+    (e.g. the common size of all parts of a batch split between processes).
+    Returns (windows, origins):
+        windows - [N, h, w] distance matrices
+        origins - [N, 2] (x, y) of windows top-left corners, may be negative
+    """
+    origins, (h, w) = batch_windows(wallmask.shape, sources, max_distance)
+    if size is not None:
+        assert size[0] >= h and size[1] >= w
+        h, w = size
+
+    # every window is cut from map padded with walls and gets a wall border
+    pad = max(-origins.min(initial=0), 0) + max(h, w)
+    padded = np.pad(wallmask, pad, mode='constant', constant_values=True)
+    walls = np.ones((len(origins), h + 2, w + 2), dtype=np.bool_)
+    walls[:, 1:-1, 1:-1] = sliding_window_view(padded, (h, w))[origins[:, 1] + pad, origins[:, 0] + pad]
+
+    block = (h + 2) * (w + 2)
+    starts = np.array([
+        i * block + (y - oy + 1) * (w + 2) + x - ox + 1
+        for i, (sp, (ox, oy)) in enumerate(zip(sources, origins))
+        for x, y in sp
+    ], dtype=np.int32)
+    dist = np.full(walls.shape, inf)
+    dist.flat[starts] = 0
+    flood_flat(walls.ravel(), dist.ravel(), starts, w + 2, max_distance)
+    return dist[:, 1:-1, 1:-1].astype(dtype, copy=False), origins
+
+
+def flood_window(
+    wallmask: np.ndarray,
+    start_points: Set[Tuple[int, int]],
+    max_distance: float,
+    dtype=np.float64
+) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """
+    Same as flood, but only the window reachable within max_distance is computed.
+    Returns (window, (x, y) of window top-left corner), see flood_batch
+    """
+    windows, origins = flood_batch(wallmask, [start_points], max_distance, dtype=dtype)
+    return windows[0], tuple(int(v) for v in origins[0])
+
+
+def crop_window(
+    window: np.ndarray,
+    origin: Tuple[int, int],
+    x0: int, x1: int, y0: int, y1: int
+) -> np.ndarray:
+    """
+    Part of window covering map rectangle [x0, x1) x [y0, y1).
+    Rectangle is cut by window bounds, cells outside of window are out of flood reach anyway.
+    """
+    ox, oy = origin
+    return window[max(y0 - oy, 0):max(y1 - oy, 0), max(x0 - ox, 0):max(x1 - ox, 0)]
+
+
+def window_to_map(shape: Tuple[int, int], window: np.ndarray, origin: Tuple[int, int]) -> np.ndarray:
+    "Distances matrix of given shape from flood_window result, cells out of window are inf"
+    output = np.full(shape, inf, dtype=window.dtype)
+    part = crop_window(window, origin, 0, shape[1], 0, shape[0])
+    x0, y0 = max(origin[0], 0), max(origin[1], 0)
+    output[y0:y0 + part.shape[0], x0:x0 + part.shape[1]] = part
+    return output
+
+
+def sum_windows(shape: Tuple[int, int], windows: np.ndarray, origins: np.ndarray) -> np.ndarray:
+    """
+    Sums windows (as produced by flood_batch) into matrix of given shape.
+    Parts of windows out of the matrix are dropped.
+    """
+    output = np.zeros(shape, dtype=windows.dtype)
+    h, w = windows.shape[1:]
+    for window, (ox, oy) in zip(windows, origins):
+        y0, x0 = max(oy, 0), max(ox, 0)
+        y1, x1 = min(oy + h, shape[0]), min(ox + w, shape[1])
+        if y0 < y1 and x0 < x1:
+            output[y0:y1, x0:x1] += window[y0 - oy:y1 - oy, x0 - ox:x1 - ox]
+    return output
+
+
 def flood(
     shape: Tuple[int, int],
     start_points: Set[Tuple[int, int]],
-    wall_predicate: Callable[[int, int], bool],
+    wall_predicate: Union[np.ndarray, Callable[[int, int], bool]],
     max_distance: float=inf
 ):
     """
     Fills matrix with distances from start_points.
     Walls constraint the flow of flood, leaving wall cells as infinitely far.
     max_distance stops the flow from too wide unnecessary spreading (lesser value = faster calculation)
+    wall_predicate may be a boolean wall mask of given shape, which is much faster.
     """
+    if isinstance(wall_predicate, np.ndarray):
+        assert wall_predicate.shape == tuple(shape)
+        return flood_mask(wall_predicate, start_points, max_distance=max_distance)
 
     output = np.full(shape, inf)
     for x, y in start_points:
@@ -59,11 +283,10 @@ def filled_mask_from_func(shape: Tuple[int, int], predicate: Callable[[int, int]
     Makes boolean 2d np.array from predicate
     wall is True
     """
-    result = np.empty(shape, dtype=np.bool_)
-    for y in range(shape[0]):
-        for x in range(shape[1]):
-            result[y, x] = predicate(x, y)
-    return result
+    return np.array([
+        [predicate(x, y) for x in range(shape[1])]
+        for y in range(shape[0])
+    ], dtype=np.bool_).reshape(shape)
 
 
 def find_locations_for_sized_object(wallmask: np.ndarray, sizex: int, sizey: int) -> np.ndarray:
@@ -73,12 +296,7 @@ def find_locations_for_sized_object(wallmask: np.ndarray, sizex: int, sizey: int
     There must bee no wall in rectangular area.
     Top-left corner coordinates returned
     """
-    shape = wallmask.shape
-    output = np.zeros(shape, dtype=np.bool_)
-    for y in range(shape[0] - sizey):
-        for x in range(shape[1] - sizex):
-            output[y, x] = not wallmask[y:y + sizey, x:x + sizex].any()
-    return np.where(output)
+    return np.where(fit_mask(wallmask, sizex, sizey))
 
 
 def find_maximums(data: np.ndarray) -> np.ndarray:
@@ -101,52 +319,30 @@ def find_maximums(data: np.ndarray) -> np.ndarray:
 def summarize_for_greater_scale(data: np.ndarray, divide: int) -> np.ndarray:
     """
     Calculates sums for rectanglar tiles of size [divide x divide]
-    Result is a smaller matrix.
-    """
-    shape = data.shape
-    out_shape = tuple(v // divide for v in shape)
-    output = np.empty(out_shape)
-    for y in range(0, shape[0], divide):
-        for x in range(0, shape[1], divide):
-            output[y // divide, x // divide] = data[y:y + divide, x:x + divide].sum()
-    return output
+    Result is a smaller matrix, partial tiles at edges are summed too.
+    """
+    return block_reduce(data, divide, 'sum').astype(np.float64, copy=False)
 
 
 def upscale_matrix(data: np.ndarray, n: int) -> np.ndarray:
-    result = np.empty(tuple(x * n for x in data.shape), dtype=data.dtype)
-    for y in range(data.shape[0]):
-        yy = y * n
-        for x in range(data.shape[1]):
-            xx = x * n
-            result[yy:yy + n, xx:xx + n] = data[y, x]
-    return result
+    return upscale(data, n)
 
 
 def make_predicate(data: np.ndarray) -> Callable[[int, int], bool]:
     return lambda x, y: data[y, x]
 
 
-def wall_distances(wallmap: np.ndarray) -> np.ndarray:
-    walldist = np.full(wallmap.shape, inf, dtype=np.float_)
-    walldist[wallmap] = 0
-
-    while True:
-        fwd, back, full = (1, None), (None, -1), (None, None)
-        inversion = {fwd: back, back: fwd, full: full}
-        for ys, xs in product((fwd, back, full), repeat=2):
-            if ys == full and xs == full:
-                continue
-            dist = SQ2 if ys != full and xs != full else 1
-            ms = (slice(*ys), slice(*xs))
-            walldist[ms] = np.minimum(
-                walldist[ms],
-                walldist[slice(*inversion[ys]), slice(*inversion[xs])] + dist
-            )
-
-        if inf not in walldist:
-            break
-
-    return walldist
+def wall_distances(wallmap: np.ndarray, metric: str='octile') -> np.ndarray:
+    """
+    Distances from every cell to the nearest wall (True), walls are 0.
+    metric is 'octile' (8-connected steps, as flood does) or 'euclidean'.
+    Without walls all cells are infinitely far.
+    """
+    if metric == 'octile':
+        return chamfer_transform(wallmap)
+    if metric == 'euclidean':
+        return euclidean_transform(wallmap)
+    raise ValueError('Unknown metric {!r}'.format(metric))
 
 
 def detect_walls(wallmap: np.ndarray) -> np.ndarray:
@@ -0,0 +1,258 @@
+from heapq import heappush, heappop
+from math import sqrt, inf
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+SQ2 = sqrt(2)
+Point = Tuple[int, int]
+
+
+def octile(x1: int, y1: int, x2: int, y2: int) -> float:
+    dx, dy = abs(x1 - x2), abs(y1 - y2)
+    return max(dx, dy) + (SQ2 - 1) * min(dx, dy)
+
+
+def octile_line(x1: int, y1: int, x2: int, y2: int, diagonal_first: bool=True) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (xs, ys) of shortest 8-connected cells path without walls,
+    diagonal steps go first (or straight ones with diagonal_first=False)
+    """
+    dx, dy = abs(x2 - x1), abs(y2 - y1)
+    sx = (x2 > x1) - (x2 < x1)
+    sy = (y2 > y1) - (y2 < y1)
+    steps = np.arange(max(dx, dy) + 1)
+    if diagonal_first:
+        return x1 + sx * np.minimum(steps, dx), y1 + sy * np.minimum(steps, dy)
+    back = steps[::-1]
+    return x2 - sx * np.minimum(back, dx), y2 - sy * np.minimum(back, dy)
+
+
+class HierarchicalPathfinder:
+    """
+    HPA* over free rectangles (x, y, w, h) of walk tiles, which cover walkable space
+    without overlapping: quadtree leaves (ChokeFinder.iter_nodes) or merged ones
+    (node mergers, fewer rectangles - faster queries).
+
+    Abstract graph nodes are entrance cells: for every pair of touching rectangles
+    cells on both sides of the middle of their common border, and of its ends
+    if the border is LONG_BORDER or longer (a cell shared by several borders is one node).
+    Any two cells of the same rectangle are connected by straight octile line,
+    costs between entrances of a rectangle are computed once, when graph is built.
+    Abstract path is refined by line of sight shortcuts in one pass over waypoints:
+    a waypoint is skipped if octile line from the last kept one to the next waypoint
+    goes through free cells (of any rectangles).
+
+    Bound: path is not longer than optimal 8-connected path (see flood_mask)
+    plus 2 * gap + 1 for every rectangle border the optimal path crosses,
+    gap is the farthest distance of border cell to an entrance (border_gaps).
+    Moving a border crossing to the nearest entrance costs at most gap
+    on each side, and 2 - sqrt(2) more for a diagonal crossing made straight.
+    """
+
+    # borders shorter than this get one entrance in the middle, longer ones - at both ends and the middle
+    LONG_BORDER = 5
+
+    def __init__(self, rects: Iterable[Tuple[int, int, int, int]], shape: Tuple[int, int]):
+        self.rects = np.array(list(rects), dtype=np.int32).reshape(-1, 4)
+        self.owner = np.full(shape, -1, dtype=np.int32)
+        for i, (x, y, w, h) in enumerate(self.rects):
+            self.owner[y:y + h, x:x + w] = i
+
+        self.border_gaps = {}  # (rect, rect) -> farthest distance of border cell to an entrance
+        cells_a, cells_b, costs = self._build_entrances()
+        self._build_nodes(cells_a, cells_b, costs)
+
+    @classmethod
+    def from_choke_finder(cls, finder, merger=None):
+        """
+        Pathfinder over quadtree leaves of called ChokeFinder,
+        merger is optional node merger class (e.g. GrowthNodeMerger)
+        """
+        nodes = finder.leaves()
+        if merger is not None:
+            nodes = merger(nodes)
+            nodes()
+        return cls(nodes, finder.mm.get_map_shape())
+
+    def _build_entrances(self):
+        """
+        Entrance pairs of all borders: flat indices of cells on both sides and step cost,
+        fills border_gaps
+        """
+        owner = self.owner
+        rows, cols = owner.shape
+        side_keys = []
+        cells_a, cells_b, costs = [], [], []
+        # (dx, dy) of a move from cell a to cell b, diagonal moves only where rectangles touch by corner
+        for dx, dy in ((1, 0), (0, 1), (1, 1), (1, -1)):
+            y0, y1 = max(-dy, 0), rows - max(dy, 0)
+            a = owner[y0:y1, :cols - dx]
+            b = owner[y0 + dy:y1 + dy, dx:]
+            ys, xs = np.nonzero((a >= 0) & (b >= 0) & (a != b))
+            if not len(ys):
+                continue
+            ra, rb = a[ys, xs], b[ys, xs]
+            order = np.lexsort((xs, ys, rb, ra))
+            ra, rb, xs, ys = ra[order], rb[order], xs[order], ys[order] + y0
+            # spans of consecutive border cells of the same rectangles pair
+            split = (ra[1:] != ra[:-1]) | (rb[1:] != rb[:-1]) | (abs(xs[1:] - xs[:-1]) + abs(ys[1:] - ys[:-1]) != 1)
+            bounds = np.flatnonzero(np.r_[True, split, True])
+            starts, ends = bounds[:-1], bounds[1:]
+            low = np.minimum(ra[starts], rb[starts]).astype(np.int64)
+            high = np.maximum(ra[starts], rb[starts]).astype(np.int64)
+            keys = low * len(self.rects) + high
+            if dx and dy:
+                corner = ~np.isin(keys, np.concatenate(side_keys))
+                starts, ends, low, high = starts[corner], ends[corner], low[corner], high[corner]
+            else:
+                side_keys.append(keys)
+
+            middle = (starts + ends - 1) // 2
+            long = ends - starts >= self.LONG_BORDER
+            gaps = np.where(long, (ends - 1 - middle) // 2, ends - 1 - middle)
+            for pair in zip(low.tolist(), high.tolist(), gaps.tolist()):
+                self.border_gaps[pair[:2]] = max(pair[2], self.border_gaps.get(pair[:2], 0))
+
+            entrances = np.concatenate((middle, starts[long], ends[long] - 1))
+            cells = ys[entrances] * cols + xs[entrances]
+            cells_a.append(cells)
+            cells_b.append(cells + dy * cols + dx)
+            costs.append(np.full(len(cells), SQ2 if dx and dy else 1.0))
+        if not cells_a:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+        return np.concatenate(cells_a), np.concatenate(cells_b), np.concatenate(costs)
+
+    def _build_nodes(self, cells_a, cells_b, costs):
+        """
+        Nodes of entrance cells (a cell shared by several borders is one node), their edges
+        across borders and costs to other nodes of the same rectangle
+        """
+        cols = self.owner.shape[1]
+        cells, inverse = np.unique(np.concatenate((cells_a, cells_b)), return_inverse=True)
+        ys, xs = np.divmod(cells, cols)
+        node_rect = self.owner.ravel()[cells]
+        self.points = list(zip(xs.tolist(), ys.tolist()))  # entrance cell of node
+        self.node_rect = node_rect.tolist()
+
+        self.edges = [[] for _ in self.points]  # node -> [(node across border, cost)]
+        count = len(cells_a)
+        for na, nb, cost in zip(inverse[:count].tolist(), inverse[count:].tolist(), costs.tolist()):
+            self.edges[na].append((nb, cost))
+            self.edges[nb].append((na, cost))
+
+        # nodes grouped by rectangle, costs of every node to all nodes of its group in group order
+        order = np.argsort(node_rect, kind='stable')
+        group_starts = np.flatnonzero(np.r_[True, node_rect[order][1:] != node_rect[order][:-1]])[:len(order)]
+        sizes = np.diff(np.r_[group_starts, len(order)])
+        self.rect_nodes = {
+            rect: nodes.tolist()
+            for rect, nodes in zip(node_rect[order[group_starts]].tolist(), np.split(order, group_starts[1:]))
+        }
+        row_sizes = np.repeat(sizes, sizes)
+        row_offsets = np.cumsum(row_sizes) - row_sizes
+        rows = np.repeat(order, row_sizes)
+        cols = order[np.repeat(np.repeat(group_starts, sizes), row_sizes) + np.arange(row_sizes.sum()) - np.repeat(row_offsets, row_sizes)]
+        d = np.abs(np.stack((xs[rows] - xs[cols], ys[rows] - ys[cols])))
+        flat = (d.max(axis=0) + (SQ2 - 1) * d.min(axis=0)).tolist()
+        self.node_costs = [None] * len(self.points)  # costs to rect_nodes of node rectangle
+        for node, offset, size in zip(order.tolist(), row_offsets.tolist(), row_sizes.tolist()):
+            self.node_costs[node] = flat[offset:offset + size]
+
+    def abstract_path(self, start: Point, goal: Point) -> Optional[List[Point]]:
+        "Waypoints from start to goal: entrance cells in between, None if there is no path"
+        start, goal = (int(start[0]), int(start[1])), (int(goal[0]), int(goal[1]))
+        sx, sy = start
+        gx, gy = goal
+        src, dst = self.owner[sy, sx], self.owner[gy, gx]
+        if src < 0 or dst < 0:
+            return None
+        if src == dst:
+            return [start, goal]
+
+        # A* on entrance nodes, -1 is start and -2 is goal
+        points, node_rect, node_costs = self.points, self.node_rect, self.node_costs
+        rect_nodes, edges = self.rect_nodes, self.edges
+        diagonal = SQ2 - 1
+        best = {-1: 0.0}
+        came = {}
+        # ties of estimate are broken towards longer paths (-rate), which are closer to goal
+        heap = [(octile(sx, sy, gx, gy), 0.0, -1)]
+        while heap:
+            _, g, nid = heappop(heap)
+            g = -g
+            if nid == -2:
+                break
+            if g > best[nid]:
+                continue
+            if nid == -1:
+                x, y = start
+                rect = int(src)
+                neighbours = [(n, octile(sx, sy, *points[n])) for n in rect_nodes.get(rect, ())]
+            else:
+                x, y = points[nid]
+                rect = node_rect[nid]
+                neighbours = list(zip(rect_nodes[rect], node_costs[nid]))
+                neighbours += edges[nid]
+            if rect == dst:
+                neighbours.append((-2, octile(x, y, gx, gy)))
+            for n, cost in neighbours:
+                rate = g + cost
+                if rate < best.get(n, inf):
+                    best[n] = rate
+                    came[n] = nid
+                    if n == -2:
+                        heappush(heap, (rate, -rate, n))
+                        continue
+                    x, y = points[n]
+                    dx, dy = abs(x - gx), abs(y - gy)
+                    h = dx + diagonal * dy if dx > dy else dy + diagonal * dx
+                    heappush(heap, (rate + h, -rate, n))
+        else:
+            return None
+
+        nodes = [-2]
+        while nodes[-1] != -1:
+            nodes.append(came[nodes[-1]])
+        return [start if n == -1 else goal if n == -2 else self.points[n] for n in reversed(nodes)]
+
+    def free_line(self, p1: Point, p2: Point) -> Optional[List[Point]]:
+        "Octile line from p1 to p2 (diagonal or straight steps first) of free cells only, None if both are blocked"
+        for diagonal_first in (True, False):
+            xs, ys = octile_line(*p1, *p2, diagonal_first)
+            if (self.owner[ys, xs] >= 0).all():
+                return list(zip(xs.tolist(), ys.tolist()))
+        return None
+
+    def shortcut(self, waypoints: List[Point]) -> List[List[Point]]:
+        """
+        Free lines between waypoints with skipping, in one pass: waypoint is skipped
+        if the last kept one reaches the next waypoint by a free line.
+        Line is never longer than the path it replaces,
+        as octile distance is the shortest 8-connected path length.
+        """
+        lines = []
+        anchor = waypoints[0]
+        # neighbour waypoints are always connected: they are in the same rectangle or an entrance pair
+        line = self.free_line(anchor, waypoints[1])
+        for i in range(1, len(waypoints) - 1):
+            farther = self.free_line(anchor, waypoints[i + 1])
+            if farther is None:
+                lines.append(line)
+                anchor = waypoints[i]
+                farther = self.free_line(anchor, waypoints[i + 1])
+            line = farther
+        assert line is not None, waypoints
+        lines.append(line)
+        return lines
+
+    def find_path(self, start: Point, goal: Point) -> Optional[List[Point]]:
+        "Cells path from start to goal (both included), None if there is no path"
+        waypoints = self.abstract_path(start, goal)
+        if waypoints is None:
+            return None
+        path = [waypoints[0]]
+        for line in self.shortcut(waypoints):
+            path.extend(line[1:])
+        return path
@@ -0,0 +1,81 @@
+import numpy as np
+
+
+class SummedAreaTable:
+    """
+    Integral image of 2d array, answers sum of any rectangle in O(1).
+    Bool and integer arrays are summed exactly (int64), others as float64.
+    Float sums are differences of large prefix sums, so their rounding error grows
+    with the whole table: sums within tolerance of 0 are made exactly 0,
+    and sums of non negative data are never negative.
+    Rectangles are (x, y, w, h) and must lie inside the array,
+    coordinates may be np.arrays to query many rectangles at once.
+    """
+    def __init__(self, data: np.ndarray):
+        if np.issubdtype(data.dtype, np.floating):
+            dtype = np.float64
+        else:
+            dtype = np.int64
+        self.shape = data.shape
+        self.table = np.zeros((data.shape[0] + 1, data.shape[1] + 1), dtype=dtype)
+        np.cumsum(np.cumsum(data, axis=0, dtype=dtype), axis=1, out=self.table[1:, 1:])
+        self.tolerance = None
+        if dtype is np.float64:
+            # error bound of 4 prefix sums, each of rows + columns additions
+            rows, cols = data.shape
+            magnitude = float(np.abs(self.table).max(initial=0))
+            self.tolerance = 4 * (rows + cols) * np.finfo(dtype).eps * magnitude
+            self.nonnegative = bool(data.min(initial=0) >= 0)
+
+    def _snap(self, sums):
+        "Float sums without rounding noise around 0"
+        if self.tolerance is None:
+            return sums
+        sums = np.where(np.abs(sums) <= self.tolerance, 0.0, sums)
+        if self.nonnegative:
+            sums = np.maximum(sums, 0.0)
+        return sums[()]
+
+    def sum(self, x, y, w, h):
+        t = self.table
+        return self._snap(t[y + h, x + w] - t[y, x + w] - t[y + h, x] + t[y, x])
+
+    def is_empty(self, x, y, w, h):
+        "No True (nonzero) cells in rectangle, for non negative data"
+        return self.sum(x, y, w, h) == 0
+
+    def window_sums(self, w: int, h: int) -> np.ndarray:
+        """
+        Sums of all w x h rectangles inside the array.
+        result[y, x] is for rectangle with top-left corner at (x, y),
+        result shape is (rows - h + 1, columns - w + 1)
+        """
+        rows, cols = self.shape
+        if h > rows or w > cols:
+            return np.zeros((max(rows - h + 1, 0), max(cols - w + 1, 0)), dtype=self.table.dtype)
+        t = self.table
+        return self._snap(t[h:, w:] - t[:-h, w:] - t[h:, :-w] + t[:-h, :-w])
+
+
+def window_sums(data: np.ndarray, w: int, h: int) -> np.ndarray:
+    "See SummedAreaTable.window_sums"
+    return SummedAreaTable(data).window_sums(w, h)
+
+
+def free_windows(mask: np.ndarray, w: int, h: int) -> np.ndarray:
+    """
+    Boolean matrix of top-left corners of w x h rectangles without True cells,
+    shaped as window_sums result.
+    """
+    return window_sums(mask, w, h) == 0
+
+
+def fit_mask(mask: np.ndarray, w: int, h: int) -> np.ndarray:
+    """
+    Boolean matrix of mask shape, True where top-left corner of w x h rectangle
+    without True cells can be placed (rectangle must fit into the matrix).
+    """
+    result = np.zeros(mask.shape, dtype=np.bool_)
+    free = free_windows(mask, w, h)
+    result[:free.shape[0], :free.shape[1]] = free
+    return result
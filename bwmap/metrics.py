@@ -1,5 +1,10 @@
+from uuid import uuid4
+
 import numpy as np
 
+from .flood import filled_mask_from_func, wall_distances
+from .cache import ANALYSIS_CACHE
+
 
 def make_metric_filled_matrix(shape, start):
     # Currently unused
@@ -9,21 +14,58 @@ def make_metric_filled_matrix(shape, start):
     return np.sqrt(np.sum(dims, axis=0))
 
 
-def _get_bool_map(shape, predicate):
-    result = np.empty(shape, dtype=np.bool_)
-    for y in range(shape[0]):
-        for x in range(shape[1]):
-            result[y, x] = predicate(x, y)
-    return result
+def bool_map_from_bulk(shape, data):
+    """
+    Makes boolean 2d np.array from whole-map data returned by game bulk accessor.
+    Data may be 2d array-like or row-major buffer of bytes (nonzero is True)
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = np.frombuffer(data, dtype=np.uint8)
+    data = np.asarray(data)
+    if data.ndim == 1:
+        data = data.reshape(shape)
+    assert data.shape == tuple(shape), '{} != {}'.format(data.shape, shape)
+    return data.astype(np.bool_)
 
 
 class MapMetrics:
-    def __init__(self, game, WALKPOSITION_SCALE, TILEPOSITION_SCALE):
+    """
+    Game object may optionally provide bulk accessors returning the whole map at once
+    (see bool_map_from_bulk), they are used instead of per cell predicates:
+        getWalkabilityArray() - walk tiles, same as isWalkable
+        getBuildabilityArray() - build tiles, same as isBuildable
+
+    Analysis products are memoized in cache (shared ANALYSIS_CACHE by default)
+    under game.mapHash(), so all analyzers of the same map share them.
+    Set up cache with DiskCache to keep them between runs.
+    """
+    def __init__(self, game, WALKPOSITION_SCALE, TILEPOSITION_SCALE, cache=None):
         self.game = game
         self.WS = WALKPOSITION_SCALE
         self.BS = TILEPOSITION_SCALE
         self.BWS = self.BS // self.WS
         assert self.BS % self.WS == 0
+        self.cache = ANALYSIS_CACHE if cache is None else cache
+        self._own_hash = 'instance-' + uuid4().hex
+
+    @property
+    def has_map_hash(self):
+        return hasattr(self.game, 'mapHash')
+
+    @property
+    def map_hash(self):
+        "Cache key of the map, game without mapHash() gets a key private to this instance"
+        if self.has_map_hash:
+            return self.game.mapHash()
+        return self._own_hash
+
+    def cached(self, key, compute):
+        "Returns cached analysis product of the map, compute() is called on a miss"
+        return self.cache.get(self.map_hash, key, compute, persistent=self.has_map_hash)
+
+    def invalidate(self, key=None):
+        "Drops cached product of the map, or all of them if key is None"
+        self.cache.invalidate(self.map_hash, key)
 
     def get_map_shape(self, scale=None):
         if scale is None:
@@ -46,11 +88,30 @@ class MapMetrics:
             (u.getBottom() + u.getTop()) // 2 // scale,
         )
 
+    def _get_bool_map(self, scale, bulk_name, predicate_name):
+        shape = self.get_map_shape(scale=scale)
+        bulk = getattr(self.game, bulk_name, None)
+        if bulk is not None:
+            return bool_map_from_bulk(shape, bulk())
+        # slow fallback, a call per cell
+        return filled_mask_from_func(shape, getattr(self.game, predicate_name))
+
     def get_walkability_map(self):
-        return _get_bool_map(self.get_map_shape(scale=self.WS), self.game.isWalkable)
+        return self.cached('walkability', lambda: self._get_bool_map(
+            self.WS, 'getWalkabilityArray', 'isWalkable'))
 
     def get_builability_map(self):
-        return _get_bool_map(self.get_map_shape(scale=self.BS), self.game.isBuildable)
+        return self.cached('buildability', lambda: self._get_bool_map(
+            self.BS, 'getBuildabilityArray', 'isBuildable'))
+
+    def get_wall_distances(self):
+        "Distances from every walk tile to the nearest unwalkable one"
+        return self.cached('wall_distances', lambda: wall_distances(~self.get_walkability_map()))
+
+    def get_quadtree_levels(self):
+        "Quadtree levels of walkability map, see choke.build_quadtree_levels"
+        from .choke import build_quadtree_levels
+        return self.cached('quadtree_levels', lambda: build_quadtree_levels(self.get_walkability_map()))
 
     @classmethod
     def from_pybrood(cls, pybrood):
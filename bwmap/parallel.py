@@ -0,0 +1,199 @@
+import os
+from itertools import repeat
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import NamedTuple, Tuple, List, Sequence, Set
+
+import numpy as np
+
+from .flood import flood_batch, batch_windows
+
+
+class SharedArray(NamedTuple):
+    """
+    Picklable reference to array placed in shared memory,
+    tasks get it instead of the array itself (see attach)
+    """
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+    # share generation of AnalysisPool, attachments of older generations are closed (see attach)
+    generation: int = 0
+
+    @classmethod
+    def create(cls, shape, dtype, generation: int=0) -> Tuple[SharedMemory, 'SharedArray']:
+        "New zero filled shared array, returns its memory block (owned by caller) and reference"
+        dtype = np.dtype(dtype)
+        block = SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+        return block, cls(block.name, tuple(shape), dtype.str, generation)
+
+    def open(self) -> Tuple[SharedMemory, np.ndarray]:
+        "Memory block and array on top of it, array must be dropped before block.close()"
+        block = SharedMemory(name=self.name)
+        return block, np.ndarray(self.shape, dtype=self.dtype, buffer=block.buf)
+
+
+# name -> (generation, memory block, read-only array) of shared inputs attached by this process
+_ATTACHED = {}
+
+
+def detach(generation: int=None):
+    "Closes attachments of generations older than given one, all of them by default"
+    for name, (gen, _, _) in list(_ATTACHED.items()):
+        if generation is None or gen < generation:
+            _, block, _ = _ATTACHED.pop(name)
+            block.close()
+
+
+def attach(array):
+    """
+    Array by SharedArray reference, attached once per process and kept for next tasks
+    of the same share generation, attachments of older generations are closed first:
+    their shares are released by the pool (see AnalysisPool.release), tasks using them are over.
+    Anything else (plain arrays of serial mode) is returned as is.
+    """
+    if not isinstance(array, SharedArray):
+        return array
+    detach(array.generation)
+    if array.name not in _ATTACHED:
+        block, data = array.open()
+        data.flags.writeable = False
+        _ATTACHED[array.name] = array.generation, block, data
+    return _ATTACHED[array.name][2]
+
+
+def _flood_batch_task(wallmask, sources, max_distance, size, out, start):
+    windows, _ = flood_batch(attach(wallmask), sources, max_distance, np.dtype(out.dtype), size)
+    block, result = out.open()
+    result[start:start + len(windows)] = windows
+    del result
+    block.close()
+
+
+class AnalysisPool:
+    """
+    Process pool for independent parts of map analysis: floods of resource units
+    and base locations (BaseFinder), choke detection (ChokeFinder).
+    Input arrays are copied into shared memory once (see share), tasks get references,
+    release frees them when they aren't needed anymore (e.g. map analysis is over).
+    workers is process count, None for all cores, 1 runs everything serially in this process.
+    Results are the same in both modes.
+    Use as context manager, processes and shared memory are released on exit.
+    """
+    # tasks per worker of a split job, to even out the load
+    CHUNKS_PER_WORKER = 4
+
+    def __init__(self, workers: int=None):
+        self.workers = os.cpu_count() if workers is None else max(workers, 1)
+        self.executor = ProcessPoolExecutor(self.workers) if self.workers > 1 else None
+        # id(array) -> (array, block, reference), array is kept alive so its id isn't reused
+        self._shared = {}
+        # increased by release, workers close attachments of older generations
+        self.generation = 0
+
+    @property
+    def parallel(self) -> bool:
+        return self.executor is not None
+
+    def share(self, array: np.ndarray):
+        "Reference to array for tasks, every array is copied into shared memory once"
+        if not self.parallel:
+            return array
+        key = id(array)
+        if key not in self._shared:
+            block, ref = SharedArray.create(array.shape, array.dtype, self.generation)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            self._shared[key] = array, block, ref
+        return self._shared[key][2]
+
+    def submit(self, func, *args) -> Future:
+        "Runs func(*args) in worker, or right away in serial mode"
+        if self.parallel:
+            return self.executor.submit(func, *args)
+        future = Future()
+        future.set_result(func(*args))
+        return future
+
+    def map(self, func, *iterables) -> List:
+        if self.parallel:
+            return list(self.executor.map(func, *iterables))
+        return list(map(func, *iterables))
+
+    def chunks(self, count: int) -> List[slice]:
+        "Splits range(count) into slices for separate tasks"
+        parts = min(count, self.workers * self.CHUNKS_PER_WORKER) if self.parallel else 1
+        bounds = np.linspace(0, count, parts + 1).round().astype(int).tolist()
+        return [slice(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+    def flood_batch(
+        self,
+        wallmask: np.ndarray,
+        sources: Sequence[Set[Tuple[int, int]]],
+        max_distance: float,
+        dtype=np.float64
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Same as flood.flood_batch, sources are split between workers,
+        which write their windows straight into shared result.
+        """
+        sources = list(sources)
+        if not self.parallel or len(sources) < 2:
+            return flood_batch(wallmask, sources, max_distance, dtype)
+        origins, size = batch_windows(wallmask.shape, sources, max_distance)
+        block, out = SharedArray.create((len(sources), *size), dtype)
+        try:
+            slices = self.chunks(len(sources))
+            self.map(
+                _flood_batch_task,
+                repeat(self.share(wallmask)), [sources[s] for s in slices],
+                repeat(max_distance), repeat(size), repeat(out), [s.start for s in slices],
+            )
+            windows = np.ndarray(out.shape, dtype=out.dtype, buffer=block.buf).copy()
+        finally:
+            block.close()
+            block.unlink()
+        return windows, origins
+
+    def release(self):
+        """
+        Frees shared memory of all shared arrays, workers close their attachments
+        with the next task of the pool. Tasks using the shares must be over.
+        """
+        for _, block, _ in self._shared.values():
+            block.close()
+            block.unlink()
+        self._shared.clear()
+        self.generation += 1
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        self.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def analyze_map(game, mm, pool: AnalysisPool=None):
+    """
+    Bases and chokes of the map, choke detection runs in a worker alongside base search.
+    Returns (valid_bases, choke analysis), see BaseFinder and ChokeFinder
+    """
+    from .resources import BaseFinder
+    from .choke import ChokeFinder
+
+    if pool is None:
+        pool = AnalysisPool(1)
+    try:
+        chokes = ChokeFinder(game, mm, pool)
+        analysis = chokes.submit()
+        valid_bases = BaseFinder(game, mm, pool)()
+        chokes.analysis = analysis.result()
+    finally:
+        # inputs of this map aren't needed by workers anymore
+        pool.release()
+    return valid_bases, chokes.analysis
@@ -0,0 +1,60 @@
+from typing import Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .regions import label_regions
+
+
+def window_max(data: np.ndarray, rx: int, ry: int) -> np.ndarray:
+    """
+    Maximum of [2 * ry + 1, 2 * rx + 1] window around every cell,
+    cells out of array are ignored. Separable, rows then columns.
+    """
+    fill = -np.inf if np.issubdtype(data.dtype, np.floating) else np.iinfo(data.dtype).min
+    padded = np.pad(data, ((ry, ry), (rx, rx)), mode='constant', constant_values=fill)
+    rows = sliding_window_view(padded, 2 * rx + 1, axis=1).max(axis=-1)
+    return sliding_window_view(rows, 2 * ry + 1, axis=0).max(axis=-1)
+
+
+def plateau_representatives(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    "(ys, xs) of the first cell (row-major) of every 8-connected region of True cells"
+    labels, _ = label_regions(mask)
+    flat = np.flatnonzero(labels)
+    _, first = np.unique(labels.ravel()[flat], return_index=True)
+    return np.unravel_index(np.sort(flat[first]), mask.shape)
+
+
+def find_peaks(data: np.ndarray, footprint: Tuple[int, int], threshold: float=0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Non-maximum suppression: peaks of data greater than threshold,
+    no two peaks are closer than footprint (w, h), that is |dx| < w and |dy| < h.
+    Cells equal to the maximum of their footprint window form plateaus,
+    every connected plateau gives one peak (its first cell in row-major order).
+    Equal peaks in each other's window are suppressed greedily in row-major order.
+    Returns (points, scores): (N, 2) int array of (x, y) and their values,
+    greatest scores first.
+    """
+    w, h = footprint
+    mask = (data >= window_max(data, w - 1, h - 1)) & (data > threshold)
+    ys, xs = plateau_representatives(mask)
+    scores = data[ys, xs]
+
+    # only equal peaks may be in each other's window, as both are maximums of it
+    _, inverse, counts = np.unique(scores, return_inverse=True, return_counts=True)
+    tied = np.flatnonzero(counts[inverse] > 1)
+    tx, ty, ts = xs[tied], ys[tied], scores[tied]
+    conflicts = (
+        (np.abs(tx[:, None] - tx[None, :]) < w) &
+        (np.abs(ty[:, None] - ty[None, :]) < h) &
+        (ts[:, None] == ts[None, :])
+    )
+    np.fill_diagonal(conflicts, False)
+    keep = np.ones(len(ys), dtype=np.bool_)
+    for i in np.flatnonzero(conflicts.any(axis=1)):
+        if keep[tied[i]]:
+            keep[tied[i + 1:][conflicts[i, i + 1:]]] = False
+
+    order = np.argsort(-scores[keep], kind='stable')
+    points = np.stack((xs[keep], ys[keep]), axis=1)
+    return points[order], scores[keep][order]
@@ -0,0 +1,84 @@
+from typing import Tuple, Iterable, Optional
+
+import numpy as np
+
+from .integral import fit_mask, free_windows
+
+
+# (width, height) in build tiles
+BUILDING_FOOTPRINTS = (
+    (2, 2),
+    (3, 2),
+    (4, 3),
+)
+
+
+class PlacementIndex:
+    """
+    Valid top-left positions of building footprints on build tiles.
+    wallmask marks unbuildable tiles (see BaseFinder.get_buildable_wall_mask),
+    placed buildings are tracked on top of it.
+    All registered footprints are kept up to date after place / remove.
+    """
+    def __init__(self, wallmask: np.ndarray, footprints: Iterable[Tuple[int, int]]=BUILDING_FOOTPRINTS):
+        self.wallmask = wallmask
+        self.occupied = np.zeros(wallmask.shape, dtype=np.bool_)
+        self.valid = {}
+        for w, h in footprints:
+            self.register(w, h)
+
+    @property
+    def walls(self):
+        return self.wallmask | self.occupied
+
+    def register(self, w: int, h: int):
+        "Adds footprint to the index, does nothing if it is registered already"
+        if (w, h) not in self.valid:
+            self.valid[w, h] = fit_mask(self.walls, w, h)
+
+    def can_place(self, x: int, y: int, w: int, h: int) -> bool:
+        "Footprint fits at top-left (x, y), positions out of map are never valid"
+        rows, cols = self.wallmask.shape
+        if x < 0 or y < 0 or x + w > cols or y + h > rows:
+            return False
+        if (w, h) in self.valid:
+            return bool(self.valid[w, h][y, x])
+        return not self.walls[y:y + h, x:x + w].any()
+
+    def _refresh(self, x: int, y: int, w: int, h: int):
+        "Recomputes positions of all footprints, which may overlap with rectangle"
+        rows, cols = self.wallmask.shape
+        for (fw, fh), valid in self.valid.items():
+            y0, x0 = max(y - fh + 1, 0), max(x - fw + 1, 0)
+            y1, x1 = min(y + h, rows), min(x + w, cols)
+            if y0 >= y1 or x0 >= x1:
+                continue
+            valid[y0:y1, x0:x1] = False
+            free = free_windows(self.walls[y0:y1 + fh - 1, x0:x1 + fw - 1], fw, fh)
+            valid[y0:y0 + free.shape[0], x0:x0 + free.shape[1]] = free
+
+    def place(self, x: int, y: int, w: int, h: int):
+        "Marks rectangle as occupied by a building"
+        self.occupied[y:y + h, x:x + w] = True
+        self._refresh(x, y, w, h)
+
+    def remove(self, x: int, y: int, w: int, h: int):
+        "Frees rectangle of destroyed building"
+        self.occupied[y:y + h, x:x + w] = False
+        self._refresh(x, y, w, h)
+
+    def candidates(self, w: int, h: int, x: float, y: float, limit: Optional[int]=None) -> np.ndarray:
+        """
+        Valid top-left positions for footprint ordered by distance
+        from footprint center to point (x, y), nearest first.
+        Returns (N, 2) array of (x, y)
+        """
+        self.register(w, h)
+        yc, xc = np.nonzero(self.valid[w, h])
+        dist = (xc + w / 2 - x) ** 2 + (yc + h / 2 - y) ** 2
+        if limit is not None and limit < len(dist):
+            order = np.argpartition(dist, limit)[:limit]
+            order = order[np.argsort(dist[order], kind='stable')]
+        else:
+            order = np.argsort(dist, kind='stable')
+        return np.stack((xc[order], yc[order]), axis=1)
@@ -0,0 +1,72 @@
+import numpy as np
+
+
+REDUCERS = ('sum', 'any', 'all', 'max', 'min', 'mean')
+
+
+def _fill_value(func, dtype):
+    "Value of padding cells, which doesn't affect reduction result"
+    if func in ('sum', 'mean', 'any'):
+        return 0
+    if func == 'all':
+        return True
+    if dtype == np.bool_:
+        return func == 'min'
+    if np.issubdtype(dtype, np.floating):
+        return -np.inf if func == 'max' else np.inf
+    info = np.iinfo(dtype)
+    return info.min if func == 'max' else info.max
+
+
+def block_reduce(data: np.ndarray, factor: int, func: str='sum', edge: str='keep') -> np.ndarray:
+    """
+    Reduces every [factor x factor] block of 2d array into one cell.
+    func is one of REDUCERS.
+    Blocks at right and bottom edges may be partial, when shape isn't divisible by factor:
+        edge='keep' - partial blocks are reduced over existing cells (result shape is rounded up)
+        edge='drop' - partial blocks are ignored (result shape is rounded down)
+    """
+    if func not in REDUCERS:
+        raise ValueError('Unknown reduce function {!r}'.format(func))
+    if edge not in ('keep', 'drop'):
+        raise ValueError('Unknown edge mode {!r}'.format(edge))
+    rows, cols = data.shape
+    if edge == 'drop':
+        data = data[:rows - rows % factor, :cols - cols % factor]
+    else:
+        pad = ((0, -rows % factor), (0, -cols % factor))
+        data = np.pad(data, pad, mode='constant', constant_values=_fill_value(func, data.dtype))
+    blocks = data.reshape(data.shape[0] // factor, factor, data.shape[1] // factor, factor)
+    if func != 'mean':
+        return getattr(blocks, func)(axis=(1, 3))
+    counts = block_reduce(np.ones((rows, cols), dtype=np.int_), factor, 'sum', edge)
+    return blocks.sum(axis=(1, 3)) / counts
+
+
+def upscale_view(data: np.ndarray, factor: int) -> np.ndarray:
+    """
+    Zero-copy read-only [rows, factor, cols, factor] view of 2d array,
+    view[y, :, x, :] repeats data[y, x].
+    Flat 2d upscaled array can't be a view, see upscale.
+    """
+    return np.broadcast_to(data[:, None, :, None], (data.shape[0], factor, data.shape[1], factor))
+
+
+def upscale(data: np.ndarray, factor: int) -> np.ndarray:
+    "Every cell becomes [factor x factor] block of the same values"
+    return upscale_view(data, factor).reshape(data.shape[0] * factor, data.shape[1] * factor)
+
+
+def rescale(data: np.ndarray, from_scale: int, to_scale: int, func: str='sum', edge: str='keep') -> np.ndarray:
+    """
+    Converts matrix between map scales (pixels per cell):
+    1 for pixels, MapMetrics.WS for walk tiles, MapMetrics.BS for build tiles.
+    Going to a greater scale reduces blocks with func, to a lesser one repeats cells.
+    """
+    if to_scale > from_scale:
+        assert to_scale % from_scale == 0
+        return block_reduce(data, to_scale // from_scale, func, edge)
+    if to_scale < from_scale:
+        assert from_scale % to_scale == 0
+        return upscale(data, from_scale // to_scale)
+    return data
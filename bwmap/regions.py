@@ -0,0 +1,132 @@
+from typing import Tuple
+
+import numpy as np
+
+from .metrics import MapMetrics
+
+
+def find_runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Horizontal runs of True cells in row-major order.
+    Returns (rows, starts, ends), ends are inclusive
+    """
+    rows, cols = mask.shape
+    padded = np.zeros((rows, cols + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    ry, rs = np.nonzero(edges == 1)
+    _, re = np.nonzero(edges == -1)
+    return ry.astype(np.int32), rs.astype(np.int32), (re - 1).astype(np.int32)
+
+
+def _touching_runs(ry, rs, re, cols, connectivity):
+    """
+    Pairs of runs touching each other in adjacent rows.
+    Run keys are increasing in row-major order, so touching runs of the next row
+    form a continuous range found with searchsorted.
+    """
+    c = 1 if connectivity == 8 else 0
+    k = cols + 2
+    start_keys = ry.astype(np.int64) * k + rs
+    end_keys = ry.astype(np.int64) * k + re
+    next_row = (ry.astype(np.int64) + 1) * k
+    lo = np.searchsorted(end_keys, next_row + rs - c, side='left')
+    hi = np.searchsorted(start_keys, next_row + re + c, side='right')
+    counts = np.maximum(hi - lo, 0)
+    first = np.repeat(np.arange(len(ry)), counts)
+    second = np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    return first, second
+
+
+def _union_roots(n, first, second):
+    """
+    Vectorized union-find: hooks greater root to lesser one for every pair
+    and flattens trees by pointer jumping until all pairs share a root.
+    Returns root of every element, which is the least element of its set.
+    """
+    parent = np.arange(n)
+    while True:
+        ra, rb = parent[first], parent[second]
+        differ = ra != rb
+        if not differ.any():
+            return parent
+        np.minimum.at(parent, np.maximum(ra, rb)[differ], np.minimum(ra, rb)[differ])
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+
+
+def label_regions(mask: np.ndarray, connectivity: int=8) -> Tuple[np.ndarray, int]:
+    """
+    Labels connected regions of True cells, connectivity is 8 (as flood moves) or 4.
+    Returns (labels, count): int32 matrix with 0 for False cells and regions numbered
+    from 1 in row-major order of their first cells.
+    """
+    assert connectivity in (4, 8)
+    ry, rs, re = find_runs(mask)
+    labels = np.zeros(mask.shape, dtype=np.int32)
+    if not len(ry):
+        return labels, 0
+    roots = _union_roots(len(ry), *_touching_runs(ry, rs, re, mask.shape[1], connectivity))
+    _, run_labels = np.unique(roots, return_inverse=True)
+    labels[mask] = np.repeat(run_labels.astype(np.int32) + 1, re - rs + 1)
+    return labels, int(run_labels.max()) + 1
+
+
+class RegionMap:
+    """
+    Connected regions of walkable space, tables are indexed by region id (0 is walls):
+        labels - int32 matrix of region ids
+        areas - cells count
+        bboxes - (x, y, w, h) bounding rectangles
+        centroids - (x, y) mean cell coordinates
+    """
+    def __init__(self, labels: np.ndarray, count: int):
+        self.labels = labels
+        self.count = count
+        flat = labels.ravel()
+        size = count + 1
+        ys, xs = np.indices(labels.shape)
+
+        self.areas = np.bincount(flat, minlength=size)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.centroids = np.stack((
+                np.bincount(flat, weights=xs.ravel(), minlength=size) / self.areas,
+                np.bincount(flat, weights=ys.ravel(), minlength=size) / self.areas,
+            ), axis=1)
+
+        # any horizontal run of region cells belongs to a single region
+        ry, rs, re = find_runs(labels > 0)
+        run_labels = labels[ry, rs]
+        lo = np.full((size, 2), np.iinfo(np.int32).max, dtype=np.int32)
+        hi = np.full((size, 2), -1, dtype=np.int32)
+        np.minimum.at(lo, run_labels, np.stack((rs, ry), axis=1))
+        np.maximum.at(hi, run_labels, np.stack((re, ry), axis=1))
+        self.bboxes = np.concatenate((lo, hi - lo + 1), axis=1)
+        self.bboxes[hi[:, 0] < 0] = 0  # walls and empty regions
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray, connectivity: int=8):
+        return cls(*label_regions(mask, connectivity))
+
+    @classmethod
+    def from_metrics(cls, mm: MapMetrics, wallmask: np.ndarray=None, connectivity: int=8):
+        """
+        Regions of walkability map, or of cells free of wallmask when it is given
+        (e.g. BaseFinder.get_walkable_wall_mask, which has resources as walls)
+        """
+        if wallmask is not None:
+            return cls.from_mask(~wallmask, connectivity)
+        labels = mm.cached(('region_labels', connectivity), lambda: label_regions(
+            mm.get_walkability_map(), connectivity)[0])
+        return cls(labels, int(labels.max()))
+
+    def region_at(self, x: int, y: int) -> int:
+        return int(self.labels[y, x])
+
+    def connected(self, x1: int, y1: int, x2: int, y2: int) -> bool:
+        "Both cells are walkable and belong to the same region"
+        r = self.labels[y1, x1]
+        return bool(r and r == self.labels[y2, x2])
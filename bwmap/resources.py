@@ -1,14 +1,17 @@
-from itertools import chain
+from itertools import chain, repeat
 from math import inf
-from functools import lru_cache
 
 import numpy as np
 
 from .metrics import MapMetrics
+from .integral import SummedAreaTable
+from .placement import PlacementIndex, BUILDING_FOOTPRINTS
+from .peaks import find_peaks
+from .parallel import AnalysisPool, attach
 from .flood import (
-    flood, summarize_for_greater_scale,
-    find_locations_for_sized_object, find_maximums,
-    make_predicate
+    flood, flood_batch, flood_window, window_to_map, sum_windows,
+    summarize_for_greater_scale,
+    find_locations_for_sized_object,
 )
 
 
@@ -18,6 +21,8 @@ GAS_IMPORTANCE = 0.6
 BASE_SIZE = (4, 3)
 MINERAL_SIZE = (2, 1)
 GEYSER_SIZE = (4, 2)
+# minimal distance in build tiles between resource depot and resources
+MINERAL_GAP = 3
 
 
 def unit_tileset(bx, by, w, h):
@@ -28,10 +33,63 @@ def unit_tileset(bx, by, w, h):
     return sp
 
 
+def valid_bases_to_json(valid_bases):
+    "Makes json serializable structure from BaseFinder result"
+    return [
+        {
+            'x': int(btx),
+            'y': int(bty),
+            'score': float(vb['score']),
+            'resources': [
+                [[int(v) for v in bounds], kind, int(amount)]
+                for bounds, kind, amount in vb['resources']
+            ],
+        }
+        for (btx, bty), vb in valid_bases.items()
+    ]
+
+
+def valid_bases_from_json(data):
+    "Reverse for valid_bases_to_json"
+    return {
+        (item['x'], item['y']): {
+            'score': item['score'],
+            'resources': [(tuple(bounds), kind, amount) for bounds, kind, amount in item['resources']],
+        }
+        for item in data
+    }
+
+
+def reached_resources(windows, origins, bounds):
+    """
+    Boolean [N, R] matrix: flood window reaches tiles around resource,
+    bounds - (R, 4) array of resource bounds (x0, x1, y0, y1) in walk tiles
+    """
+    reached = np.zeros((len(windows), len(bounds)), dtype=np.bool_)
+    rows, cols = windows.shape[1:]
+    for i, ((ox, oy), window) in enumerate(zip(origins, windows)):
+        # tiles around resource, cut by window bounds like crop_window
+        x0 = np.clip(bounds[:, 0] - 1 - ox, 0, cols)
+        x1 = np.clip(bounds[:, 1] + 1 - ox, 0, cols)
+        y0 = np.clip(bounds[:, 2] - 1 - oy, 0, rows)
+        y1 = np.clip(bounds[:, 3] + 1 - oy, 0, rows)
+        reached[i] = ~SummedAreaTable(window < inf).is_empty(x0, y0, x1 - x0, y1 - y0)
+    return reached
+
+
+def _reached_resources_task(wallmask, sources, max_distance, bounds):
+    return reached_resources(*flood_batch(attach(wallmask), sources, max_distance, dtype=np.float32), bounds)
+
+
 class BaseFinder:
-    def __init__(self, game, mm: MapMetrics):
+    """
+    pool runs floods of resource units and base locations in parallel (see AnalysisPool),
+    serial by default
+    """
+    def __init__(self, game, mm: MapMetrics, pool: AnalysisPool=None):
         self.game = game
         self.mm = mm
+        self.pool = AnalysisPool(1) if pool is None else pool
         self.FLOOD_DISTANCE = 10 * mm.BWS
 
     @staticmethod
@@ -45,6 +103,9 @@ class BaseFinder:
         """
         if scale is None:
             scale = self.mm.WS
+        return self.mm.cached(('unit_mask', scale, gap), lambda: self._make_unit_mask(scale, gap))
+
+    def _make_unit_mask(self, scale, gap):
         shape = self.mm.get_map_shape(scale=scale)
         result = np.zeros(shape, dtype=np.bool_)
         for u in chain(self.game.getMinerals(), self.game.getGeysers()):
@@ -55,23 +116,27 @@ class BaseFinder:
             ] = True
         return result
 
-    @lru_cache(1)
     def get_walkable_wall_mask(self):
-        return self.make_unit_mask() | ~self.mm.get_walkability_map()
+        return self.mm.cached('walkable_wall_mask', lambda: (
+            self.make_unit_mask() | ~self.mm.get_walkability_map()))
 
-    @lru_cache(1)
     def get_buildable_wall_mask(self):
-        return self.make_unit_mask(scale=self.mm.BS, gap=3) | ~self.mm.get_builability_map()
+        return self.mm.cached('buildable_wall_mask', lambda: (
+            self.make_unit_mask(scale=self.mm.BS, gap=MINERAL_GAP) | ~self.mm.get_builability_map()))
 
-    @lru_cache(1)
     def get_possible_base_locations(self):
-        yc, xc = find_locations_for_sized_object(
-            self.get_buildable_wall_mask(), *BASE_SIZE)
-        return yc, xc
+        return self.mm.cached('possible_base_locations', lambda: find_locations_for_sized_object(
+            self.get_buildable_wall_mask(), *BASE_SIZE))
+
+    def make_placement_index(self, footprints=BUILDING_FOOTPRINTS):
+        "Building placement index over buildable tiles free of resources"
+        return PlacementIndex(self.get_buildable_wall_mask(), footprints)
 
-    @lru_cache(1)
     def get_possible_base_locations_mask(self):
         "Mostly for debug drawing"
+        return self.mm.cached('possible_base_locations_mask', self._make_possible_base_locations_mask)
+
+    def _make_possible_base_locations_mask(self):
         result = np.zeros(self.mm.get_map_shape(scale=self.mm.BS), dtype=np.bool_)
         yc, xc = self.get_possible_base_locations()
         for dy in range(BASE_SIZE[1]):
@@ -80,31 +145,42 @@ class BaseFinder:
                 result[ycc, xc + dx] = True
         return result
 
-    def flood_resource_unit(self, u, max_distance=inf):
-        "Fill distances from resource unit"
+    def resource_unit_tileset(self, u):
         bs = self.mm.get_unit_bounds(u)
-        return flood(
-            self.mm.get_map_shape(),
-            unit_tileset(bs[0], bs[2], bs[1] - bs[0], bs[3] - bs[2]),
-            make_predicate(self.get_walkable_wall_mask()),
-            max_distance=max_distance,
-        )
+        return unit_tileset(bs[0], bs[2], bs[1] - bs[0], bs[3] - bs[2])
 
-    def flood_base_location(self, btx, bty, wall_predicate, max_distance=inf):
-        "Fill distances from base location"
-        return flood(
-            self.mm.get_map_shape(),
-            unit_tileset(*(x * self.mm.BWS for x in (btx, bty, *BASE_SIZE))),
-            wall_predicate,
-            max_distance=max_distance,
+    def flood_resource_unit(self, u, max_distance=inf):
+        "Fill distances from resource unit, see flood_resource_units for many units at once"
+        return window_to_map(self.mm.get_map_shape(), *flood_window(
+            self.get_walkable_wall_mask(), self.resource_unit_tileset(u), max_distance))
+
+    def flood_resource_units(self, units, max_distance):
+        """
+        Fill distances from every resource unit in one pass.
+        Returns windows around units and their origins, see flood_batch
+        """
+        return self.pool.flood_batch(
+            self.get_walkable_wall_mask(),
+            [self.resource_unit_tileset(u) for u in units],
+            max_distance,
         )
 
-    def resource_unit_scores(self, u):
+    def flood_base_location(self, btx, bty, walls, max_distance=inf):
+        """
+        Fill distances from base location
+        walls is a wall mask or a wall predicate (slow)
+        """
+        sources = self.base_location_tileset(btx, bty)
+        if callable(walls):
+            return flood(self.mm.get_map_shape(), sources, walls, max_distance=max_distance)
+        return window_to_map(self.mm.get_map_shape(), *flood_window(walls, sources, max_distance))
+
+    def distance_scores(self, distances):
         """
         Transforms distances from resource into resource availability rating.
         Greater value is better
         """
-        distances = self.flood_resource_unit(u, max_distance=self.FLOOD_DISTANCE)
+        distances = distances.copy()
         distances[distances <= 0] = inf
         return np.maximum(
             self.res_per_second(distances / self.mm.BWS) -
@@ -112,20 +188,55 @@ class BaseFinder:
             0
         )
 
+    def base_location_tileset(self, btx, bty):
+        "Walk tiles of resource depot at build tile (btx, bty)"
+        return unit_tileset(*(x * self.mm.BWS for x in (btx, bty, *BASE_SIZE)))
+
+    def flood_base_window(self, btx, bty, max_distance):
+        """
+        Fill distances from base location, only for the window in reach of max_distance.
+        Returns window and its origin, see flood_window
+        """
+        return flood_window(
+            self.get_walkable_wall_mask(),
+            self.base_location_tileset(btx, bty),
+            max_distance,
+            dtype=np.float32,
+        )
+
+    def assign_resources(self, locations, bounds):
+        """
+        For every resource: index of the first base location, which reaches tiles
+        around resource within FLOOD_DISTANCE, -1 if none of them does.
+        locations - base locations in order of preference,
+        bounds - (R, 4) array of resource bounds (x0, x1, y0, y1) in walk tiles
+        """
+        bounds = np.asarray(bounds, dtype=np.int32).reshape(-1, 4)
+        sources = [self.base_location_tileset(btx, bty) for btx, bty in locations]
+        if not sources or not len(bounds):
+            return np.full(len(bounds), -1)
+        slices = self.pool.chunks(len(sources))
+        reached = np.concatenate(self.pool.map(
+            _reached_resources_task,
+            repeat(self.pool.share(self.get_walkable_wall_mask())), [sources[s] for s in slices],
+            repeat(self.FLOOD_DISTANCE), repeat(bounds),
+        ))
+        return np.where(reached.any(axis=0), reached.argmax(axis=0), -1)
+
+    def resource_unit_scores(self, u):
+        return self.distance_scores(self.flood_resource_unit(u, max_distance=self.FLOOD_DISTANCE))
+
     def all_resource_units_scores(self, iterunits_func):
-        "Computes normalized [0..1] sum of ratings (resource_unit_scores) for all resource units"
-        resource_scores = np.zeros(self.mm.get_map_shape())
-        sz = len(iterunits_func())
-        for i, u in enumerate(iterunits_func()):
-            resource_scores += self.resource_unit_scores(u)
-            print(u.getID(), '{}/{}'.format(i + 1, sz))
+        "Normalized [0..1] sum of distance_scores of all resource units, floods within FLOOD_DISTANCE"
+        windows, origins = self.flood_resource_units(iterunits_func(), self.FLOOD_DISTANCE)
+        resource_scores = sum_windows(self.mm.get_map_shape(), self.distance_scores(windows), origins)
         return resource_scores / resource_scores.max()
 
     def mineral_scoremap(self):
-        return self.all_resource_units_scores(self.game.getMinerals)
+        return self.mm.cached('mineral_scoremap', lambda: self.all_resource_units_scores(self.game.getMinerals))
 
     def gas_scoremap(self):
-        return self.all_resource_units_scores(self.game.getGeysers)
+        return self.mm.cached('gas_scoremap', lambda: self.all_resource_units_scores(self.game.getGeysers))
 
     def resource_scoremap(self):
         return (
@@ -136,62 +247,46 @@ class BaseFinder:
 
     def build_place_scores(self, scores):
         yc, xc = self.get_possible_base_locations()
+        sat = SummedAreaTable(scores)
         result = np.zeros_like(scores)
-        for y, x in zip(yc, xc):
-            result[y, x] = (  # perimeter sum
-                scores[y:y + BASE_SIZE[1], x:x + BASE_SIZE[0]].sum() -
-                scores[y + 1:y + BASE_SIZE[1] - 1, x + 1:x + BASE_SIZE[0] - 1].sum()
-            )
+        result[yc, xc] = (  # perimeter sum
+            sat.sum(xc, yc, *BASE_SIZE) -
+            sat.sum(xc + 1, yc + 1, BASE_SIZE[0] - 2, BASE_SIZE[1] - 2)
+        )
         return result
 
     def __call__(self):
+        return valid_bases_from_json(self.mm.cached('valid_bases', lambda: valid_bases_to_json(self.find_bases())))
+
+    def find_bases(self):
         resource_scores = self.resource_scoremap()
 
         btile_scores = summarize_for_greater_scale(resource_scores, self.mm.BWS)
         yc, xc = self.get_possible_base_locations()
         bplace_scores = np.zeros_like(btile_scores)
-        for x, y in zip(xc, yc):
-            bplace_scores[y, x] = btile_scores[y:y + BASE_SIZE[1], x:x + BASE_SIZE[0]].sum()
-
-        bplace_ext = find_maximums(bplace_scores)
-        bplace_ext &= bplace_scores > 0
-
-        all_resource_units = {}
-        for u in self.game.getMinerals():
-            all_resource_units[u.getID()] = (
-                self.mm.get_unit_bounds(u),
-                'minerals', u.getResources(),
-            )
-        for u in self.game.getGeysers():
-            all_resource_units[u.getID()] = (
-                self.mm.get_unit_bounds(u),
-                'gas', u.getResources(),
-            )
-
-        possible_bases = [(btx, bty, bplace_scores[bty, btx]) for bty, btx in zip(*np.where(bplace_ext))]
-        possible_bases.sort(key=lambda x: -x[2])
+        bplace_scores[yc, xc] = SummedAreaTable(btile_scores).sum(xc, yc, *BASE_SIZE)
+
+        # depots closer than this are alternatives of the same base
+        footprint = (BASE_SIZE[0] + MINERAL_GAP, BASE_SIZE[1] + MINERAL_GAP)
+        candidates, candidate_scores = find_peaks(bplace_scores, footprint)
+
+        resource_units = [
+            (self.mm.get_unit_bounds(u), 'minerals', u.getResources())
+            for u in self.game.getMinerals()
+        ] + [
+            (self.mm.get_unit_bounds(u), 'gas', u.getResources())
+            for u in self.game.getGeysers()
+        ]
+        # every resource belongs to the best base location reaching it
+        owners = self.assign_resources(candidates, [bounds for bounds, _, _ in resource_units])
+
         valid_bases = {}
-        for i, (btx, bty, base_score) in enumerate(possible_bases):
-            base_distances = self.flood_base_location(
-                btx, bty, make_predicate(self.get_walkable_wall_mask()),
-                max_distance=self.FLOOD_DISTANCE)
-
-            resources_to_pop = set()
-            for ruid in all_resource_units.keys():
-                rpos = all_resource_units[ruid][0]
-                if np.any(base_distances[rpos[2] - 1:rpos[3] + 1, rpos[0] - 1:rpos[1] + 1] < inf):
-                    resources_to_pop.add(ruid)
-
-            vb = {
-                'score': base_score,
-                'resources': [all_resource_units.pop(ruid) for ruid in resources_to_pop],
+        # a base MUST have resources
+        for i in np.unique(owners[owners >= 0]).tolist():
+            btx, bty = candidates[i].tolist()
+            valid_bases[(btx, bty)] = {
+                'score': candidate_scores[i],
+                'resources': [resource_units[r] for r in np.flatnonzero(owners == i)],
             }
-            if vb['resources']:
-                # a base MUST have resources
-                valid_bases[(btx, bty)] = vb
-
-            if not all_resource_units:
-                # no resources left, leaving loop
-                break
 
         return valid_bases
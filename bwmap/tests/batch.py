@@ -0,0 +1,112 @@
+"""
+Analysis of every map snapshot in a folder, results of map <maphash> in output folder:
+    <maphash>.analysis.json - bases with their resources, regions, chokes and region graph
+    <maphash>.analysis.npz - region labels matrix of walk tiles
+    <maphash>.png - rendering, if asked for
+json is written last, so it marks complete results.
+"""
+import os
+import json
+from time import perf_counter
+from os.path import join, exists, getmtime
+
+import numpy as np
+
+from ..cache import ANALYSIS_VERSION
+from ..metrics import MapMetrics
+from ..parallel import AnalysisPool, analyze_map
+from ..resources import valid_bases_to_json
+from ..choke import choke_analysis_to_json
+from .mocks import PybroodMock, list_snapshots, snapshot_files
+
+
+RESULT_SUFFIX = '.analysis'
+
+
+def result_paths(output_folder, maphash):
+    path = join(output_folder, maphash + RESULT_SUFFIX)
+    return path + '.json', path + '.npz'
+
+
+def results_current(snapshot_folder, output_folder, maphash) -> bool:
+    "Results exist, are made by current ANALYSIS_VERSION and are newer than the snapshot"
+    json_path, npz_path = result_paths(output_folder, maphash)
+    if not exists(json_path) or not exists(npz_path):
+        return False
+    with open(json_path) as f:
+        if json.load(f).get('version') != ANALYSIS_VERSION:
+            return False
+    snapshot_time = max(getmtime(fname) for fname in snapshot_files(maphash, snapshot_folder))
+    return getmtime(json_path) >= snapshot_time
+
+
+def _write(fname, writer):
+    "Writes through temporary file, so complete results are never partial"
+    tmp = '{}.{}.tmp'.format(fname, os.getpid())
+    with open(tmp, 'wb') as f:
+        writer(f)
+    os.replace(tmp, fname)
+
+
+def analyze_snapshot(snapshot_folder, output_folder, maphash, pool: AnalysisPool=None, render=False):
+    "Analyzes one map snapshot and writes its results, pool is for parallel analysis of the map, serial by default"
+    from .render import render_map
+
+    pybrood = PybroodMock(maphash, snapshot_folder)
+    mm = MapMetrics.from_pybrood(pybrood)
+    valid_bases, chokes = analyze_map(pybrood.game, mm, pool)
+
+    json_path, npz_path = result_paths(output_folder, maphash)
+    _write(npz_path, lambda f: np.savez_compressed(f, region_labels=chokes.regions.labels))
+    if render:
+        render_map(pybrood.game, mm, valid_bases, join(output_folder, maphash + '.png'), chokes)
+    result = {
+        'version': ANALYSIS_VERSION,
+        'mapHash': maphash,
+        'mapWidth': pybrood.game.mapWidth(),
+        'mapHeight': pybrood.game.mapHeight(),
+        'bases': valid_bases_to_json(valid_bases),
+        **choke_analysis_to_json(chokes),
+    }
+    _write(json_path, lambda f: f.write(json.dumps(result).encode()))
+
+
+def _analyze_snapshot_task(snapshot_folder, output_folder, maphash, render):
+    "Serial analysis of a whole map in a worker, returns seconds spent"
+    started = perf_counter()
+    analyze_snapshot(snapshot_folder, output_folder, maphash, render=render)
+    return perf_counter() - started
+
+
+def analyze_all(snapshot_folder, output_folder, workers=1, render=False, force=False, log=print):
+    """
+    Analyzes every map snapshot of snapshot_folder (both formats),
+    maps with current results are skipped unless force is set.
+    workers processes (None for all cores) analyze whole maps, one map per worker at once;
+    a single map is analyzed by all of them together instead (see AnalysisPool).
+    Returns names of analyzed maps.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    pending = []
+    for maphash in list_snapshots(snapshot_folder):
+        if maphash.endswith(RESULT_SUFFIX):
+            # output folder may be the snapshot folder
+            continue
+        if not force and results_current(snapshot_folder, output_folder, maphash):
+            log('{}: up to date'.format(maphash))
+            continue
+        pending.append(maphash)
+
+    with AnalysisPool(workers) as pool:
+        if len(pending) == 1:
+            started = perf_counter()
+            analyze_snapshot(snapshot_folder, output_folder, pending[0], pool, render)
+            log('{}: analyzed in {:.2f}s'.format(pending[0], perf_counter() - started))
+        else:
+            futures = [
+                pool.submit(_analyze_snapshot_task, snapshot_folder, output_folder, maphash, render)
+                for maphash in pending
+            ]
+            for maphash, future in zip(pending, futures):
+                log('{}: analyzed in {:.2f}s'.format(maphash, future.result()))
+    return pending
@@ -0,0 +1,156 @@
+"""
+Benchmarks of analysis stages on synthetic maps (see synthetic).
+Every stage is timed on its own, inputs are computed beforehand.
+Time is the best of repeat samples, fast stages are run in loops of at least MIN_SAMPLE seconds.
+Peak memory of a stage is measured in a separate run traced by tracemalloc,
+which sees numpy allocations as well.
+Results are compared with baseline json of earlier run on the same machine:
+    {"<walk size>": {"<stage>": {"seconds": ..., "peak_bytes": ...}}}
+"""
+import json
+import tracemalloc
+from math import ceil
+from time import perf_counter
+from collections import OrderedDict
+
+from ..cache import AnalysisCache
+from ..metrics import MapMetrics
+from ..flood import flood, wall_distances, find_locations_for_sized_object
+from ..choke import (
+    build_quadtree_levels, quadtree_leaves, detect_chokes,
+    SameSideNodeMerger, GrowthNodeMerger,
+)
+from ..resources import BaseFinder, BASE_SIZE
+from .synthetic import synthetic_game
+
+
+SIZES = (128, 512, 1024)
+# names of make_stages in order
+STAGES = (
+    'flood',
+    'wall_distances',
+    'find_locations_for_sized_object',
+    'build_quadtree_levels',
+    'same_side_merger',
+    'growth_merger',
+    'detect_chokes',
+    'base_finder',
+)
+# relative growth of time and peak memory over baseline, which is reported as regression
+TIME_TOLERANCE = 0.25
+MEMORY_TOLERANCE = 0.10
+# time changes less than this are noise
+MIN_TIME_DELTA = 0.002
+MIN_SAMPLE = 0.05
+
+
+def metrics(game) -> MapMetrics:
+    "MapMetrics with its own cache, so nothing is reused between runs"
+    return MapMetrics(game, 8, 32, cache=AnalysisCache())
+
+
+def make_stages(game):
+    "OrderedDict of stage name -> function without arguments"
+    mm = metrics(game)
+    walkable = mm.get_walkability_map()
+    wallmask = ~walkable
+    walldist = mm.get_wall_distances()
+    leaves = quadtree_leaves(mm.get_quadtree_levels())
+    buildable_wallmask = BaseFinder(game, mm).get_buildable_wall_mask()
+    x, y = game.getStartLocations()[0]
+    start = {(x * mm.BWS, y * mm.BWS)}
+
+    stages = OrderedDict((
+        ('flood', lambda: flood(walkable.shape, start, wallmask)),
+        ('wall_distances', lambda: wall_distances(wallmask)),
+        # depot places on build tiles, as BaseFinder.get_possible_base_locations does
+        ('find_locations_for_sized_object', lambda: find_locations_for_sized_object(
+            buildable_wallmask, *BASE_SIZE)),
+        ('build_quadtree_levels', lambda: build_quadtree_levels(walkable)),
+        ('same_side_merger', lambda: SameSideNodeMerger(leaves)()),
+        ('growth_merger', lambda: GrowthNodeMerger(leaves)()),
+        ('detect_chokes', lambda: detect_chokes(walkable, walldist)),
+        ('base_finder', lambda: BaseFinder(game, metrics(game))()),
+    ))
+    assert tuple(stages) == STAGES
+    return stages
+
+
+def time_stage(func, repeat: int) -> float:
+    "Seconds per func() call"
+    started = perf_counter()
+    func()
+    loops = max(1, ceil(MIN_SAMPLE / max(perf_counter() - started, 1e-9)))
+    best = None
+    for _ in range(repeat):
+        started = perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = (perf_counter() - started) / loops
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def peak_memory(func) -> int:
+    "Peak of memory allocated during func() over memory allocated before it, in bytes"
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        func()
+        return tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+
+
+def check_stages(stages):
+    "Raises ValueError if there are unknown names among stages"
+    unknown = sorted(set(stages) - set(STAGES))
+    if unknown:
+        raise ValueError('unknown stages: {} (available: {})'.format(', '.join(unknown), ', '.join(STAGES)))
+
+
+def run_benchmarks(sizes=SIZES, repeat: int=3, stages=None, seed: int=0, log=print):
+    """
+    Results in baseline format, stages is a collection of stage names to run (all by default),
+    ValueError is raised for unknown ones
+    """
+    check_stages(stages or ())
+    results = OrderedDict()
+    for size in sizes:
+        game = synthetic_game(size, seed)
+        results[str(size)] = size_results = OrderedDict()
+        for name, func in make_stages(game).items():
+            if stages and name not in stages:
+                continue
+            size_results[name] = {
+                'seconds': time_stage(func, repeat),
+                'peak_bytes': peak_memory(func),
+            }
+            log('{:>5} {:<32} {:9.4f}s {:9.2f}MB'.format(
+                size, name, size_results[name]['seconds'], size_results[name]['peak_bytes'] / 2 ** 20))
+    return results
+
+
+def compare(results, baseline, time_tolerance=TIME_TOLERANCE, memory_tolerance=MEMORY_TOLERANCE):
+    "Regressions as list of (size, stage, measure, baseline value, value), stages missing from baseline are skipped"
+    regressions = []
+    for size, stages in results.items():
+        for name, values in stages.items():
+            base = baseline.get(size, {}).get(name)
+            if base is None:
+                continue
+            if values['seconds'] > max(base['seconds'] * (1 + time_tolerance), base['seconds'] + MIN_TIME_DELTA):
+                regressions.append((size, name, 'seconds', base['seconds'], values['seconds']))
+            if values['peak_bytes'] > base['peak_bytes'] * (1 + memory_tolerance):
+                regressions.append((size, name, 'peak_bytes', base['peak_bytes'], values['peak_bytes']))
+    return regressions
+
+
+def load_baseline(fname):
+    with open(fname) as f:
+        return json.load(f)
+
+
+def save_baseline(fname, results):
+    with open(fname, 'w') as f:
+        json.dump(results, f, indent=2)
@@ -1,5 +1,3 @@
-from PIL import Image, ImageDraw
-
 from ..metrics import MapMetrics
 from .mocks import PybroodMock
 from .render import MapRenderer
@@ -30,15 +28,15 @@ def v2(maphash):
     gscores = gscores / gscores.max()
 
     rnd = MapRenderer(pybrood.game, mm)
-    rnd.draw_walkable_map(lambda x, y: (int(255 * mscores[y, x]), int(255 * gscores[y, x]), 0))
-    rnd.im.save('v2.png')
+    rnd.draw_rgb(red=mscores, green=gscores)
+    rnd.save('v2.png')
 
     full_scores = mscores * gscores
     full_scores = full_scores / gscores.max()
 
     rnd = MapRenderer(pybrood.game, mm)
-    rnd.draw_walkable_map(lambda x, y: (int(255 * full_scores[y, x]), int(255 * full_scores[y, x]), 0))
-    rnd.im.save('v3.png')
+    rnd.draw_rgb(red=full_scores, green=full_scores)
+    rnd.save('v3.png')
 
 
 def node_merge(maphash):
@@ -50,48 +48,99 @@ def node_merge(maphash):
 
     finder()
 
-    PX_SIZE = 4
-
-    walkmap = mm.get_walkability_map()
+    walkable = mm.get_walkability_map()
+    rnd = MapRenderer(pybrood.game, mm, px_size=4)
+    rnd.draw_mask(walkable, (200, 200, 200))
+    rnd.draw_mask(~walkable, (100, 100, 100))
 
-    im = Image.new('RGB', tuple(reversed([x * PX_SIZE for x in walkmap.shape])))
-    draw = ImageDraw.Draw(im, 'RGBA')
-    for y in range(walkmap.shape[0]):
-        for x in range(walkmap.shape[1]):
-            color = (200, 200, 200) if walkmap[y, x] else (100, 100, 100)
-            draw.rectangle((x * PX_SIZE, y * PX_SIZE, (x + 1) * PX_SIZE, (y + 1) * PX_SIZE), fill=color)
-
-    merger = GrowthNodeMerger(finder.iter_nodes())
+    merger = GrowthNodeMerger(finder.leaves())
     merger()
 
     for x, y, szx, szy in merger:
-        draw.rectangle((x * PX_SIZE, y * PX_SIZE, (x + szx) * PX_SIZE, (y + szy) * PX_SIZE), outline=(0, 0, 0))
+        rnd.draw_walkable_rect(x, y, szx, szy, outline=(0, 0, 0))
 
-    im.save('choke.png')
+    rnd.save('choke.png')
 
 
 def chokes(maphash):
-    from ..flood import wall_distances, detect_walls
+    from ..flood import detect_walls
+    from ..choke import ChokeFinder
 
     pybrood = PybroodMock(maphash)
     mm = MapMetrics.from_pybrood(pybrood)
-
-    walldist = wall_distances(~mm.get_walkability_map())
-    walldist = walldist / walldist.max()
-
-    thinwalls = detect_walls(~mm.get_walkability_map())
-
-    PX_SIZE = 4
-    im = Image.new('RGB', tuple(reversed([x * PX_SIZE for x in walldist.shape])))
-    draw = ImageDraw.Draw(im, 'RGBA')
-    for y in range(walldist.shape[0]):
-        for x in range(walldist.shape[1]):
-            # if walldist[y, x] == 0:
-            #     color = 0
-            # else:
-            #     color = int(walldist[y, x] * 200 + 50)
-            color = 255 if thinwalls[y, x] else 0
-            color = (color, color, color)
-            draw.rectangle((x * PX_SIZE, y * PX_SIZE, (x + 1) * PX_SIZE, (y + 1) * PX_SIZE), fill=color)
-
-    im.save('walldist.png')
+    analysis = ChokeFinder(pybrood.game, mm)()
+
+    rnd = MapRenderer(pybrood.game, mm, px_size=4)
+    rnd.draw_field(mm.get_wall_distances(), alpha=0.5)
+    rnd.draw_labels(analysis.regions.labels, alpha=0.3)
+    rnd.draw_mask(detect_walls(~mm.get_walkability_map()), (255, 255, 255))
+
+    for choke in analysis.chokes:
+        (x1, y1), (x2, y2) = choke.ends
+        rnd.draw_walkable_line(x1, y1, x2, y2, fill=(255, 0, 0), width=rnd.px_size)
+
+    rnd.save('walldist.png')
+
+
+# commit of node mergers before their rewrite, merge_benchmark compares current ones with them
+LEGACY_COMMIT = '88dac85'
+
+
+def load_legacy_module(name, commit=LEGACY_COMMIT):
+    """
+    Module bwmap.<name> as it was at commit, source is taken by git show,
+    so this runs in the repository only. Relative imports give current modules.
+    """
+    import subprocess
+    from os.path import dirname
+    from types import ModuleType
+
+    path = '{}:bwmap/{}.py'.format(commit, name)
+    source = subprocess.run(
+        ['git', 'show', path], cwd=dirname(__file__), capture_output=True, text=True, check=True,
+    ).stdout
+    module = ModuleType('bwmap.legacy_{}'.format(name))
+    module.__package__ = 'bwmap'
+    exec(compile(source, path, 'exec'), module.__dict__)
+    return module
+
+
+def merge_benchmark(maphashes, repeat=3):
+    """
+    Best of repeat times of node mergers on quadtree leaves of map snapshots,
+    current mergers side by side with legacy ones (see load_legacy_module), which must give the same nodes
+    """
+    import io
+    from time import perf_counter
+    from contextlib import redirect_stdout
+    from ..choke import quadtree_leaves, SameSideNodeMerger, GrowthNodeMerger
+
+    legacy_choke = load_legacy_module('choke')
+
+    def run(merger_class, leaves):
+        best = None
+        for _ in range(repeat):
+            started = perf_counter()
+            # legacy SameSideNodeMerger prints its merge steps
+            with redirect_stdout(io.StringIO()):
+                merger = merger_class(leaves)
+                merger()
+            elapsed = perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return merger, best
+
+    for maphash in maphashes:
+        pybrood = PybroodMock(maphash)
+        mm = MapMetrics.from_pybrood(pybrood)
+        leaves = quadtree_leaves(mm.get_quadtree_levels())
+        for legacy_class, merger_class in (
+            (legacy_choke.SameSideNodeMerger, SameSideNodeMerger),
+            (legacy_choke.GrowthNodeMerger, GrowthNodeMerger),
+        ):
+            # legacy mergers take a list of (x, y, w, h) tuples
+            legacy, legacy_time = run(legacy_class, [tuple(node) for node in leaves.tolist()])
+            merger, merger_time = run(merger_class, leaves)
+            assert sorted(legacy) == sorted(merger), '{} nodes differ from legacy'.format(merger_class.__name__)
+            print('{} {}: {} -> {} nodes, legacy {:.3f}s, now {:.3f}s, {:.1f}x faster'.format(
+                maphash, merger_class.__name__, len(leaves), len(merger.nodes),
+                legacy_time, merger_time, legacy_time / merger_time))
@@ -0,0 +1,141 @@
+"""
+Single file map snapshot:
+    MAGIC | header size (uint32) | json header | arrays
+Header holds map info and offset, dtype and shape of every array.
+Arrays are raw little-endian data aligned to ALIGN bytes, so they are memory-mapped on load.
+Walkability and buildability are bit-packed along rows (little bit order).
+"""
+import os
+import json
+import struct
+from typing import NamedTuple, Tuple, Dict
+
+import numpy as np
+
+
+MAGIC = b'BWMAPSNP'
+FORMAT_VERSION = 1
+ALIGN = 64
+SNAPSHOT_EXT = '.bwsnap'
+
+UNIT_DTYPE = np.dtype([
+    ('id', '<i4'),
+    ('resources', '<i4'),
+    ('left', '<i4'),
+    ('right', '<i4'),
+    ('top', '<i4'),
+    ('bottom', '<i4'),
+])
+
+
+class Snapshot(NamedTuple):
+    map_hash: str
+    map_width: int
+    map_height: int
+    start_locations: Tuple[Tuple[int, int], ...]
+    walkable: np.ndarray  # bool [height, width] of walk tiles
+    buildable: np.ndarray  # bool [height, width] of build tiles
+    heights: np.ndarray  # uint8 [height, width] of build tiles
+    minerals: np.ndarray  # UNIT_DTYPE [count]
+    geysers: np.ndarray  # UNIT_DTYPE [count]
+
+
+def unit_array(units) -> np.ndarray:
+    "Structured UNIT_DTYPE array of game units"
+    return np.array([
+        (u.getID(), u.getResources(), u.getLeft(), u.getRight(), u.getTop(), u.getBottom())
+        for u in units
+    ], dtype=UNIT_DTYPE)
+
+
+def _pack_mask(mask: np.ndarray) -> np.ndarray:
+    return np.packbits(np.asarray(mask, dtype=np.bool_), axis=1, bitorder='little')
+
+
+def _unpack_mask(packed: np.ndarray, width: int) -> np.ndarray:
+    return np.unpackbits(packed, axis=1, count=width, bitorder='little').view(np.bool_)
+
+
+def write_snapshot(fname, snapshot: Snapshot):
+    "Writes whole snapshot at once, through temporary file"
+    arrays = {
+        'walkable': _pack_mask(snapshot.walkable),
+        'buildable': _pack_mask(snapshot.buildable),
+        'heights': np.asarray(snapshot.heights, dtype=np.uint8),
+        'minerals': np.asarray(snapshot.minerals, dtype=UNIT_DTYPE),
+        'geysers': np.asarray(snapshot.geysers, dtype=UNIT_DTYPE),
+    }
+    header = {
+        'version': FORMAT_VERSION,
+        'mapHash': snapshot.map_hash,
+        'mapWidth': snapshot.map_width,
+        'mapHeight': snapshot.map_height,
+        'startLocations': [list(map(int, loc)) for loc in snapshot.start_locations],
+        'masks': {
+            'walkable': snapshot.walkable.shape[1],
+            'buildable': snapshot.buildable.shape[1],
+        },
+        'arrays': {},
+    }
+    # offsets are relative to the start of arrays, which is known once header is encoded
+    offset = 0
+    for name, data in arrays.items():
+        header['arrays'][name] = {'offset': offset, 'dtype': data.dtype.descr, 'shape': data.shape}
+        offset += -(-data.nbytes // ALIGN) * ALIGN
+    head = json.dumps(header).encode()
+    start = -(-(len(MAGIC) + 4 + len(head)) // ALIGN) * ALIGN
+    head = head.ljust(start - len(MAGIC) - 4)
+
+    tmp = '{}.{}.tmp'.format(fname, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(head)) + head)
+        for name, data in arrays.items():
+            f.seek(start + header['arrays'][name]['offset'])
+            f.write(np.ascontiguousarray(data).data)
+        f.truncate(start + offset)
+    os.replace(tmp, fname)
+
+
+def _dtype(descr) -> np.dtype:
+    "dtype from json round-tripped descr"
+    if len(descr) == 1 and not descr[0][0]:
+        return np.dtype(descr[0][1])
+    return np.dtype([tuple(field) for field in descr])
+
+
+def read_header(raw: np.ndarray) -> Tuple[Dict, int]:
+    "(header, start of arrays) of snapshot file bytes"
+    if raw[:len(MAGIC)].tobytes() != MAGIC:
+        raise ValueError('not a map snapshot')
+    size, = struct.unpack('<I', raw[len(MAGIC):len(MAGIC) + 4].tobytes())
+    start = len(MAGIC) + 4 + size
+    header = json.loads(raw[len(MAGIC) + 4:start].tobytes())
+    if header['version'] > FORMAT_VERSION:
+        raise ValueError('map snapshot version {} is not supported'.format(header['version']))
+    return header, start
+
+
+def read_snapshot(fname) -> Snapshot:
+    """
+    Snapshot with arrays memory-mapped (read-only) from file,
+    only bit-packed masks are unpacked into memory.
+    """
+    raw = np.memmap(fname, dtype=np.uint8, mode='r')
+    header, start = read_header(raw)
+    arrays = {}
+    for name, info in header['arrays'].items():
+        dtype = _dtype(info['dtype'])
+        shape = tuple(info['shape'])
+        pos = start + info['offset']
+        size = int(np.prod(shape)) * dtype.itemsize
+        arrays[name] = raw[pos:pos + size].view(dtype).reshape(shape)
+    for name, width in header['masks'].items():
+        arrays[name] = _unpack_mask(arrays[name], width)
+        arrays[name].flags.writeable = False
+    return Snapshot(
+        map_hash=header['mapHash'],
+        map_width=header['mapWidth'],
+        map_height=header['mapHeight'],
+        start_locations=tuple(tuple(loc) for loc in header['startLocations']),
+        **arrays
+    )
@@ -1,11 +1,53 @@
 import json
-from os.path import join
+import os
+from os.path import join, exists
 
+import numpy as np
 from PIL import Image
 
+from .mapfile import SNAPSHOT_EXT, UNIT_DTYPE, read_snapshot
+
 
 DATA_FOLDER = 'data'
 
+# ground height level -> color in _height.png
+HEIGHT_COLORS = {
+    0: (0, 255, 0),
+    1: (0, 127, 0),
+    2: (255, 255, 0),
+    3: (127, 127, 0),
+    4: (255, 0, 0),
+    5: (127, 0, 0),
+}
+
+
+def read_mask(fname):
+    "Boolean array of grayscale image, nonzero pixels are True"
+    with Image.open(fname) as im:
+        return np.asarray(im.convert('L')) > 0
+
+
+def read_heights(fname):
+    "uint8 array of ground height levels from color coded image (see HEIGHT_COLORS)"
+    with Image.open(fname) as im:
+        rgb = np.asarray(im.convert('RGB')).astype(np.int32)
+    keys = (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+    levels, colors = zip(*sorted(HEIGHT_COLORS.items(), key=lambda item: item[1]))
+    color_keys = np.array([(r << 16) | (g << 8) | b for r, g, b in colors])
+    index = np.searchsorted(color_keys, keys).clip(max=len(color_keys) - 1)
+    assert (color_keys[index] == keys).all(), 'unknown height color in ' + fname
+    return np.array(levels, dtype=np.uint8)[index]
+
+
+def frozen(data):
+    data.flags.writeable = False
+    return data
+
+
+def unit_dicts(units: np.ndarray):
+    "UNIT_DTYPE array as list of dicts of ints, the same as in json snapshot"
+    return [dict(zip(UNIT_DTYPE.names, map(int, u))) for u in units.tolist()]
+
 
 class UnitMock:
     def __init__(self, data):
@@ -30,16 +72,73 @@ class UnitMock:
         return self.data['bottom']
 
 
+# files of snapshot in older format
+IMAGE_SNAPSHOT_SUFFIXES = ('.json', '_walk.png', '_build.png', '_height.png')
+
+
+def snapshot_files(fname, folder=None):
+    "Paths of files holding map snapshot, single file format is preferred, empty if there is none"
+    folder = DATA_FOLDER if folder is None else folder
+    if exists(join(folder, fname + SNAPSHOT_EXT)):
+        return [join(folder, fname + SNAPSHOT_EXT)]
+    if exists(join(folder, fname + '.json')):
+        return [join(folder, fname + suffix) for suffix in IMAGE_SNAPSHOT_SUFFIXES]
+    return []
+
+
+def list_snapshots(folder=None):
+    "Sorted names of map snapshots of either format in folder (DATA_FOLDER by default)"
+    names = os.listdir(DATA_FOLDER if folder is None else folder)
+    return sorted({
+        name[:-len(suffix)]
+        for name in names for suffix in (SNAPSHOT_EXT, '.json')
+        if name.endswith(suffix)
+    })
+
+
 class GameMock:
-    def __init__(self, fname):
-        with open(join(DATA_FOLDER, fname + '.json')) as f:
-            self.data = json.load(f)
-        self.walkable = Image.open(join(DATA_FOLDER, fname + '_walk.png'))
-        self.buildable = Image.open(join(DATA_FOLDER, fname + '_build.png'))
+    """
+    Game of map snapshot from folder (DATA_FOLDER by default),
+    single file format (see mapfile) is used if it exists,
+    otherwise older one: <fname>.json with units and _walk, _build, _height images.
+    Snapshot object (mapfile.Snapshot) may be given instead, e.g. a generated map (see synthetic).
+    """
+    def __init__(self, fname, folder=None, snapshot=None):
+        self.fname = fname
+        self.folder = DATA_FOLDER if folder is None else folder
+        if snapshot is not None:
+            self._use_snapshot(snapshot)
+        elif exists(join(self.folder, fname + SNAPSHOT_EXT)):
+            self._use_snapshot(read_snapshot(join(self.folder, fname + SNAPSHOT_EXT)))
+        else:
+            self._load_images(join(self.folder, fname))
         self.slocs = tuple(self.data['startLocations'])
         self.minerals = tuple(UnitMock(u) for u in self.data['minerals'])
         self.geysers = tuple(UnitMock(u) for u in self.data['geysers'])
 
+    def _load_images(self, path):
+        with open(path + '.json') as f:
+            self.data = json.load(f)
+        # images are decoded once, queries are answered from arrays
+        self.walkable = frozen(read_mask(path + '_walk.png'))
+        self.buildable = frozen(read_mask(path + '_build.png'))
+        self.heights = frozen(read_heights(path + '_height.png'))
+
+    def _use_snapshot(self, snapshot):
+        self.walkable = snapshot.walkable
+        self.buildable = snapshot.buildable
+        self.heights = snapshot.heights
+        self.data = {
+            'mapHeight': snapshot.map_height,
+            'mapWidth': snapshot.map_width,
+            'startLocations': [list(loc) for loc in snapshot.start_locations],
+            'minerals': unit_dicts(snapshot.minerals),
+            'geysers': unit_dicts(snapshot.geysers),
+        }
+
+    def mapHash(self):
+        return self.fname
+
     def mapHeight(self):
         return self.data['mapHeight']
 
@@ -47,10 +146,25 @@ class GameMock:
         return self.data['mapWidth']
 
     def isWalkable(self, x, y):
-        return self.walkable.getpixel((x, y)) > 0
+        return bool(self.walkable[y, x])
 
     def isBuildable(self, x, y):
-        return self.buildable.getpixel((x, y)) > 0
+        return bool(self.buildable[y, x])
+
+    def getGroundHeight(self, x, y):
+        return int(self.heights[y, x])
+
+    def getWalkabilityArray(self):
+        "Whole map of walk tiles, bool [height, width], read-only"
+        return self.walkable
+
+    def getBuildabilityArray(self):
+        "Whole map of build tiles, bool [height, width], read-only"
+        return self.buildable
+
+    def getGroundHeightArray(self):
+        "Whole map of build tiles, uint8 [height, width] of height levels, read-only"
+        return self.heights
 
     def getStartLocations(self):
         return self.slocs
@@ -66,8 +180,8 @@ class PybroodMock:
     WALKPOSITION_SCALE = 8
     TILEPOSITION_SCALE = 32
 
-    def __init__(self, map_hash):
-        self.game = GameMock(map_hash)
+    def __init__(self, map_hash, folder=None):
+        self.game = GameMock(map_hash, folder)
 
     # m.game = GameMock('ac00190eb40d77eaf0dbf9e6a1030f4eb5229e7d')
     # m.game = GameMock('b48cd49f154e3ecc5ec4af83566a6f02480e95f2')  # Lost Temple
@@ -1,34 +1,160 @@
+import numpy as np
 from PIL import Image, ImageDraw
 
 from ..metrics import MapMetrics
 from ..resources import BASE_SIZE
 
 
+# color stops of colormaps, values are spread evenly between them
+GRAY = ((0, 0, 0), (255, 255, 255))
+HEAT = ((0, 0, 0), (160, 0, 0), (255, 160, 0), (255, 255, 160))
+
+
+def colormap_table(colors=GRAY, levels: int=256) -> np.ndarray:
+    "[3, levels] float32 table of RGB planes, interpolated between color stops"
+    stops = np.linspace(0, 1, len(colors))
+    colors = np.asarray(colors, dtype=np.float32)
+    grid = np.linspace(0, 1, levels)
+    return np.stack([np.interp(grid, stops, colors[:, c]) for c in range(3)]).astype(np.float32)
+
+
+def apply_colormap(values: np.ndarray, colors=GRAY) -> np.ndarray:
+    "RGB planes [3, h, w] float32 for values in [0..1], looked up in 256 levels table"
+    table = colormap_table(colors)
+    index = (np.clip(values, 0, 1) * (table.shape[1] - 1)).round().astype(np.intp)
+    return np.take(table, index, axis=1)
+
+
+def label_palette(count: int, seed: int=0) -> np.ndarray:
+    "[3, count + 1] random bright RGB planes for labels 0..count, the same for the same seed"
+    return np.random.default_rng(seed).integers(64, 256, (3, count + 1)).astype(np.float32)
+
+
 class MapRenderer:
-    def __init__(self, game, mm: MapMetrics):
+    """
+    Debug image of the map, one image pixel is a walk tile, upscaled px_size times on output.
+    Raster layers (draw_mask, draw_field, draw_labels, draw_rgb) are alpha-blended
+    over canvas as arrays, layer data may be given at walk or build tiles (scale).
+    Canvas is kept as [3, h, w] color planes: numpy loops over 3 channels of a pixel are slow.
+    Vector shapes (rectangles, lines, text) are drawn with ImageDraw over the composed image,
+    so they must go after all raster layers. Coordinates are in walk or build tiles.
+    """
+    def __init__(self, game, mm: MapMetrics, px_size: int=1, background=(0, 0, 0)):
         self.game = game
         self.mm = mm
-        self.im = Image.new('RGB', self.wh)
-        self.draw = ImageDraw.Draw(self.im, 'RGBA')
+        self.px_size = px_size
+        self.canvas = np.empty((3, *self.shape), dtype=np.float32)
+        self.canvas[...] = np.asarray(background, dtype=np.float32)[:, None, None]
+        self._im = None
+        self._draw = None
 
     @property
-    def wh(self):
+    def shape(self):
         return self.mm.get_map_shape(scale=self.mm.WS)
 
-    def draw_walkable_tile(self, x, y, color):
-        self.draw.point((x, y), fill=color)
+    @property
+    def wh(self):
+        rows, cols = self.shape
+        return cols * self.px_size, rows * self.px_size
+
+    def _walk_tiles(self, data: np.ndarray, scale=None) -> np.ndarray:
+        "Layer data (last two axes) at walk tiles, cells of greater scale are repeated"
+        factor = 1 if scale is None else scale // self.mm.WS
+        if factor > 1:
+            data = np.repeat(np.repeat(data, factor, axis=-2), factor, axis=-1)
+        rows, cols = self.shape
+        assert data.shape[-2] >= rows and data.shape[-1] >= cols, data.shape
+        return data[..., :rows, :cols]
+
+    def _blend_planes(self, planes: np.ndarray, alpha):
+        "planes [3, h, w] (or broadcastable to it) blended with alpha number or [h, w] array"
+        assert self._im is None, 'raster layers must be drawn before vector shapes'
+        delta = planes - self.canvas
+        delta *= alpha
+        self.canvas += delta
+
+    def blend(self, rgb: np.ndarray, alpha=1.0, scale=None):
+        """
+        Blends [h, w, 3] colors over canvas,
+        alpha is opacity in [0..1]: a number or [h, w] array
+        """
+        planes = self._walk_tiles(np.moveaxis(np.asarray(rgb, dtype=np.float32), -1, 0), scale)
+        alpha = np.asarray(alpha, dtype=np.float32)
+        self._blend_planes(planes, self._walk_tiles(alpha, scale) if alpha.ndim else alpha)
+
+    def draw_mask(self, mask: np.ndarray, color, scale=None):
+        "Paints True cells with RGB or RGBA color (alpha is 0..255)"
+        alpha = np.float32(color[3] / 255 if len(color) > 3 else 1.0)
+        color = np.asarray(color[:3], dtype=np.float32)[:, None, None]
+        self._blend_planes(color, self._walk_tiles(mask, scale) * alpha)
+
+    def draw_field(self, values: np.ndarray, colors=GRAY, alpha=1.0, scale=None, vmin=None, vmax=None):
+        """
+        Scalar field through colormap (see apply_colormap), values are normalized
+        from [vmin..vmax] (finite values range by default), not finite values are transparent.
+        """
+        values = self._walk_tiles(np.asarray(values, dtype=np.float32), scale)
+        finite = np.isfinite(values)
+        if not finite.any():
+            return
+        if vmin is None:
+            vmin = values.min(initial=np.inf, where=finite)
+        if vmax is None:
+            vmax = values.max(initial=-np.inf, where=finite)
+        with np.errstate(invalid='ignore'):
+            norm = (values - vmin) / (vmax - vmin or 1)
+        norm[~finite] = 0
+        self._blend_planes(apply_colormap(norm, colors), finite * np.float32(alpha))
+
+    def draw_labels(self, labels: np.ndarray, alpha=0.5, scale=None, seed=0):
+        "Every label gets its own random color, label 0 is transparent"
+        labels = self._walk_tiles(labels, scale)
+        palette = label_palette(int(labels.max(initial=0)), seed)
+        self._blend_planes(np.take(palette, labels, axis=1), (labels > 0) * np.float32(alpha))
+
+    def draw_rgb(self, red=None, green=None, blue=None, alpha=1.0, scale=None):
+        "Channels from [0..1] fields, missing ones are zero"
+        shape = next(c.shape for c in (red, green, blue) if c is not None)
+        planes = np.stack([
+            np.zeros(shape, dtype=np.float32) if c is None else np.clip(c, 0, 1).astype(np.float32) * 255
+            for c in (red, green, blue)
+        ])
+        alpha = np.asarray(alpha, dtype=np.float32)
+        self._blend_planes(self._walk_tiles(planes, scale), self._walk_tiles(alpha, scale) if alpha.ndim else alpha)
+
+    @property
+    def im(self) -> Image.Image:
+        "Composed image, raster layers can't be added after it is made"
+        if self._im is None:
+            planes = self.canvas.round().astype(np.uint8)
+            if self.px_size > 1:
+                planes = np.repeat(np.repeat(planes, self.px_size, axis=1), self.px_size, axis=2)
+            # planes are contiguous, interleaving them is done by PIL
+            self._im = Image.merge('RGB', [Image.fromarray(plane, 'L') for plane in planes])
+        return self._im
 
-    def draw_buildable_tile(self, x, y, color):
-        BWS = self.mm.BWS
-        x, y = x * BWS, y * BWS
-        self.draw.rectangle((x, y, x + BWS - 1, y + BWS - 1), fill=color)
+    @property
+    def draw(self) -> ImageDraw.ImageDraw:
+        "ImageDraw over composed image, coordinates are image pixels"
+        if self._draw is None:
+            self._draw = ImageDraw.Draw(self.im, 'RGBA')
+        return self._draw
 
     def draw_walkable_rect(self, x, y, w, h, **kw):
-        self.draw.rectangle((x, y, x + w, y + h), **kw)
+        px = self.px_size
+        self.draw.rectangle((x * px, y * px, (x + w) * px, (y + h) * px), **kw)
 
     def draw_buildable_rect(self, x, y, w, h, **kw):
         BWS = self.mm.BWS
-        self.draw.rectangle((x * BWS, y * BWS, (x + w) * BWS, (y + h) * BWS), **kw)
+        self.draw_walkable_rect(x * BWS, y * BWS, w * BWS, h * BWS, **kw)
+
+    def draw_walkable_line(self, x1, y1, x2, y2, **kw):
+        "Line between centers of walk tiles"
+        px = self.px_size
+        self.draw.line((x1 * px + px // 2, y1 * px + px // 2, x2 * px + px // 2, y2 * px + px // 2), **kw)
+
+    def draw_walkable_text(self, x, y, text, **kw):
+        self.draw.text((x * self.px_size, y * self.px_size), text, **kw)
 
     def draw_unit_outline(self, u, color):
         WS = self.mm.WS
@@ -40,33 +166,22 @@ class MapRenderer:
             outline=color
         )
 
-    def draw_walkable_map(self, color_func):
-        w, h = self.wh
-        for y in range(h):
-            for x in range(w):
-                color = color_func(x, y)
-                if color is not None:
-                    self.draw_walkable_tile(x, y, color)
-
-    def draw_buildable_map(self, color_func):
-        w, h = self.mm.get_map_shape(scale=self.mm.BS)
-        for y in range(h):
-            for x in range(w):
-                color = color_func(x, y)
-                if color is not None:
-                    self.draw_buildable_tile(x, y, color)
-
-    def walkable_color(self, wall, space):
-        return lambda x, y: space if self.game.isWalkable(x, y) else wall
-
-    def buildable_color(self, wall, space):
-        return lambda x, y: space if self.game.isBuildable(x, y) else wall
+    def save(self, fname):
+        self.im.save(fname)
 
 
-def render_map(game, mm: MapMetrics, valid_bases, output_fname='out.png'):
+def render_map(game, mm: MapMetrics, valid_bases, output_fname='out.png', chokes=None):
+    "Bases and resources, regions and choke lines of ChokeAnalysis if chokes is given"
     rnd = MapRenderer(game, mm)
-    rnd.draw_walkable_map(rnd.walkable_color((100, 100, 100), (150, 150, 150)))
-    rnd.draw_buildable_map(rnd.buildable_color((0, 0, 0, 40), None))
+    walkable = mm.get_walkability_map()
+    rnd.draw_mask(walkable, (150, 150, 150))
+    rnd.draw_mask(~walkable, (100, 100, 100))
+    rnd.draw_mask(~mm.get_builability_map(), (0, 0, 0, 40), scale=mm.BS)
+    if chokes is not None:
+        rnd.draw_labels(chokes.regions.labels, alpha=0.2)
+        for choke in chokes.chokes:
+            (x1, y1), (x2, y2) = choke.ends
+            rnd.draw_walkable_line(x1, y1, x2, y2, fill=(255, 0, 0))
 
     for x, y in game.getStartLocations():
         rnd.draw_buildable_rect(x, y, *BASE_SIZE, outline=(200, 200, 40))
@@ -84,7 +199,7 @@ def render_map(game, mm: MapMetrics, valid_bases, output_fname='out.png'):
             ub = u[0]
             ux = (ub[0] + ub[1]) // 2
             uy = (ub[2] + ub[3]) // 2
-            rnd.draw.line((cx, cy, ux, uy), fill=(0, 255, 0, 80))
-        rnd.draw.text((x * mm.BWS, y * mm.BWS), '{:.0f}'.format(vb['score']), fill=(0, 0, 0))
+            rnd.draw_walkable_line(cx, cy, ux, uy, fill=(0, 255, 0, 80))
+        rnd.draw_walkable_text(x * mm.BWS, y * mm.BWS, '{:.0f}'.format(vb['score']), fill=(0, 0, 0))
 
-    rnd.im.save(output_fname)
+    rnd.save(output_fname)
@@ -1,58 +1,57 @@
-import json
+import os
 from os.path import join
 
-from PIL import Image
+import numpy as np
 
-from .mocks import DATA_FOLDER
+from .mocks import DATA_FOLDER, IMAGE_SNAPSHOT_SUFFIXES, GameMock
+from .mapfile import SNAPSHOT_EXT, Snapshot, unit_array, write_snapshot
 
 
-def get_unit_data(u):
-    return {
-        'id': u.getID(),
-        'resources': u.getResources(),
-        'left': u.getLeft(),
-        'right': u.getRight(),
-        'top': u.getTop(),
-        'bottom': u.getBottom(),
-    }
+# walk tiles per build tile side
+BWS = 4
+
+
+def grid_from_game(game, shape, bulk, predicate, dtype=np.bool_):
+    "[height, width] array by game bulk accessor if it has one, or by point queries"
+    if hasattr(game, bulk):
+        return np.asarray(getattr(game, bulk)(), dtype=dtype).reshape(shape)
+    query = getattr(game, predicate)
+    return np.array([[query(x, y) for x in range(shape[1])] for y in range(shape[0])], dtype=dtype)
+
+
+def game_snapshot(game, map_hash) -> Snapshot:
+    height, width = game.mapHeight(), game.mapWidth()
+    return Snapshot(
+        map_hash=map_hash,
+        map_width=width,
+        map_height=height,
+        start_locations=tuple(tuple(loc) for loc in game.getStartLocations()),
+        walkable=grid_from_game(game, (height * BWS, width * BWS), 'getWalkabilityArray', 'isWalkable'),
+        buildable=grid_from_game(game, (height, width), 'getBuildabilityArray', 'isBuildable'),
+        heights=grid_from_game(game, (height, width), 'getGroundHeightArray', 'getGroundHeight', np.uint8),
+        minerals=unit_array(game.getMinerals()),
+        geysers=unit_array(game.getGeysers()),
+    )
 
 
 def save_real_game(game, fname):
-    from bakabot.maptools import BWS
-
-    with open(join(DATA_FOLDER, fname + '.json'), 'w') as f:
-        json.dump({
-            'mapHeight': game.mapHeight(),
-            'mapWidth': game.mapWidth(),
-            'startLocations': game.getStartLocations(),
-            'minerals': [get_unit_data(u) for u in game.getMinerals()],
-            'geysers': [get_unit_data(u) for u in game.getGeysers()],
-        }, f, indent=2)
-
-    shape = (game.mapWidth() * BWS, game.mapHeight() * BWS)
-    im = Image.new('L', shape)
-    for y in range(shape[1]):
-        for x in range(shape[0]):
-            im.putpixel((x, y), 255 if game.isWalkable(x, y) else 0)
-    im.save(join(DATA_FOLDER, fname + '_walk.png'))
-
-    shape = (game.mapWidth(), game.mapHeight())
-    im_build = Image.new('L', shape)
-    im_height = Image.new('RGB', shape)
-    heights = {
-        0: (0, 255, 0),
-        1: (0, 127, 0),
-        2: (255, 255, 0),
-        3: (127, 127, 0),
-        4: (255, 0, 0),
-        5: (127, 0, 0),
-    }
-    for y in range(shape[1]):
-        for x in range(shape[0]):
-            im_build.putpixel((x, y), 255 if game.isBuildable(x, y) else 0)
-            im_height.putpixel((x, y), heights[game.getGroundHeight(x, y)])
-    im_build.save(join(DATA_FOLDER, fname + '_build.png'))
-    im_height.save(join(DATA_FOLDER, fname + '_height.png'))
+    write_snapshot(join(DATA_FOLDER, fname + SNAPSHOT_EXT), game_snapshot(game, game.mapHash()))
+
+
+def old_snapshots():
+    "Names of snapshots in DATA_FOLDER which are only in PNG + JSON format"
+    return sorted(
+        name[:-len('.json')] for name in os.listdir(DATA_FOLDER)
+        if name.endswith('.json') and not os.path.exists(join(DATA_FOLDER, name[:-len('.json')] + SNAPSHOT_EXT))
+    )
+
+
+def convert_snapshot(fname, remove_old=False):
+    "Rewrites PNG + JSON snapshot in single file format"
+    write_snapshot(join(DATA_FOLDER, fname + SNAPSHOT_EXT), game_snapshot(GameMock(fname), fname))
+    if remove_old:
+        for suffix in IMAGE_SNAPSHOT_SUFFIXES:
+            os.remove(join(DATA_FOLDER, fname + suffix))
 
 
 def save_map_from_bwapi():
@@ -0,0 +1,99 @@
+"""
+Deterministic synthetic maps for benchmarks, no snapshot files are needed.
+The same size and seed always give the same map:
+    - walls at map borders and random rectangular obstacles
+    - walls across the map with a few gaps, so there are regions and chokes
+    - base sites on a grid, every one with cleared buildable area,
+      a column of minerals at the left and a geyser at the right of depot place
+"""
+import numpy as np
+
+from .mapfile import Snapshot, UNIT_DTYPE
+from .mocks import GameMock
+
+
+# walk tiles per build tile side, pixels per build tile side
+BWS = 4
+BUILD_TILE = 32
+
+# distance between base sites and offset of the first one, in build tiles
+BASE_PITCH = 40
+BASE_OFFSET = 12
+# walk tiles of map area per random obstacle
+OBSTACLE_AREA = 2000
+OBSTACLE_SIZE = (4, 20)
+WALL_THICKNESS = 8
+WALL_GAPS = 2
+WALL_GAP_SIZE = 12
+
+
+def _units(tiles, resources, start_id):
+    "UNIT_DTYPE array from (x, y, w, h) build tile rectangles"
+    return np.array([
+        (start_id + i, resources, x * BUILD_TILE, (x + w) * BUILD_TILE - 1, y * BUILD_TILE, (y + h) * BUILD_TILE - 1)
+        for i, (x, y, w, h) in enumerate(tiles)
+    ], dtype=UNIT_DTYPE)
+
+
+def base_sites(build_size):
+    "(x, y) build tiles of depot places"
+    coords = range(BASE_OFFSET, build_size - BASE_OFFSET + 1, BASE_PITCH)
+    return [(x, y) for y in coords for x in coords]
+
+
+def synthetic_snapshot(walk_size: int, seed: int=0) -> Snapshot:
+    "Square map of walk_size x walk_size walk tiles, walk_size must be a multiple of BWS"
+    assert walk_size % BWS == 0
+    rng = np.random.default_rng(seed)
+    build_size = walk_size // BWS
+
+    walkable = np.ones((walk_size, walk_size), dtype=np.bool_)
+    for _ in range(walk_size * walk_size // OBSTACLE_AREA):
+        x, y = rng.integers(0, walk_size, 2)
+        w, h = rng.integers(*OBSTACLE_SIZE, 2)
+        walkable[y:y + h, x:x + w] = False
+
+    # walls across the map at thirds, every one with its own gaps
+    for pos in (walk_size // 3, walk_size * 2 // 3):
+        for axis in (0, 1):
+            wall = np.ones(walk_size, dtype=np.bool_)
+            for gap in rng.integers(0, walk_size - WALL_GAP_SIZE, WALL_GAPS):
+                wall[gap:gap + WALL_GAP_SIZE] = False
+            if axis == 0:
+                walkable[:, pos:pos + WALL_THICKNESS] &= ~wall[:, None]
+            else:
+                walkable[pos:pos + WALL_THICKNESS, :] &= ~wall[None, :]
+
+    border = BWS
+    walkable[:border] = walkable[-border:] = False
+    walkable[:, :border] = walkable[:, -border:] = False
+
+    sites = base_sites(build_size)
+    for cx, cy in sites:
+        walkable[(cy - 7) * BWS:(cy + 10) * BWS, (cx - 7) * BWS:(cx + 13) * BWS] = True
+    buildable = walkable.reshape(build_size, BWS, build_size, BWS).all(axis=(1, 3))
+
+    minerals = []
+    geysers = []
+    for cx, cy in sites:
+        minerals += [(cx - 5, cy - 3 + i, 2, 1) for i in range(7)] + [(cx - 3, cy - 4, 2, 1)]
+        geysers.append((cx + 7, cy - 1, 4, 2))
+    minerals = _units(minerals, 1500, 1)
+    geysers = _units(geysers, 5000, len(minerals) + 1)
+
+    return Snapshot(
+        map_hash='synthetic-{}-{}'.format(walk_size, seed),
+        map_width=build_size,
+        map_height=build_size,
+        start_locations=tuple(sites[:4]),
+        walkable=walkable,
+        buildable=buildable,
+        heights=np.zeros((build_size, build_size), dtype=np.uint8),
+        minerals=minerals,
+        geysers=geysers,
+    )
+
+
+def synthetic_game(walk_size: int, seed: int=0) -> GameMock:
+    snapshot = synthetic_snapshot(walk_size, seed)
+    return GameMock(snapshot.map_hash, snapshot=snapshot)
@@ -0,0 +1,16 @@
+from ..cache import AnalysisCache
+from ..metrics import MapMetrics
+from ..choke import detect_chokes
+from .synthetic import synthetic_game
+
+
+def test_one_choke_per_region_pair():
+    game = synthetic_game(512)
+    mm = MapMetrics(game, 8, 32, cache=AnalysisCache())
+    analysis = detect_chokes(mm.get_walkability_map(), mm.get_wall_distances())
+    pairs = [choke.regions for choke in analysis.chokes]
+    assert len(pairs) == len(set(pairs))
+    assert len({frozenset(choke.ends) for choke in analysis.chokes}) == len(analysis.chokes)
+    assert all(a != b for a, b in pairs)
+    for rid, edges in analysis.graph.items():
+        assert len({nb for nb, _ in edges}) == len(edges)
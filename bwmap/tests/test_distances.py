@@ -0,0 +1,36 @@
+import numpy as np
+
+from ..cache import AnalysisCache
+from ..metrics import MapMetrics
+from ..resources import BaseFinder
+from ..choke import ChokeFinder
+from ..distances import DistanceTable
+from ..hpa import SQ2
+from .synthetic import synthetic_game
+
+
+def path_length(path):
+    return sum(SQ2 if x1 != x2 and y1 != y2 else 1.0 for (x1, y1), (x2, y2) in zip(path, path[1:]))
+
+
+def test_paths_match_distances():
+    game = synthetic_game(256)
+    mm = MapMetrics(game, 8, 32, cache=AnalysisCache())
+    finder = BaseFinder(game, mm)
+    chokes = ChokeFinder(game, mm)().chokes
+    table = DistanceTable.from_bases(finder, chokes=chokes)
+    assert len(table.nodes) > len(chokes) > 0
+    assert np.allclose(table.distances, table.distances.T)
+
+    walkable = ~finder.get_walkable_wall_mask()
+    for a in table.nodes:
+        for b in table.nodes:
+            path = table.path(a, b)
+            if not np.isfinite(table.distance(a, b)):
+                assert path == []
+                continue
+            assert path[0] in table.node_tiles(a) and path[-1] in table.node_tiles(b)
+            assert all(walkable[y, x] for x, y in path[1:-1])
+            assert abs(path_length(path) - table.distance(a, b)) < 1e-9
+            assert table.path(b, a) == path[::-1]
+    assert table.distance(chokes[0], chokes[0]) == 0
@@ -0,0 +1,69 @@
+import numpy as np
+
+from ..cache import AnalysisCache
+from ..metrics import MapMetrics
+from ..flood import flood_mask, trace_path
+from ..choke import ChokeFinder, GrowthNodeMerger, SameSideNodeMerger
+from ..hpa import HierarchicalPathfinder, SQ2
+from .synthetic import synthetic_game
+
+
+def path_length(path):
+    return sum(SQ2 if x1 != x2 and y1 != y2 else 1.0 for (x1, y1), (x2, y2) in zip(path, path[1:]))
+
+
+def check_paths(size, merger, queries=40, seed=0):
+    """
+    Paths of random walkable pairs against flood_mask: path is 8-connected over walkable cells,
+    not longer than the bound of HierarchicalPathfinder (optimal + 2 * gap + 1 per
+    rectangle border crossed by the optimal path). Returns length / optimal ratios.
+    """
+    game = synthetic_game(size)
+    mm = MapMetrics(game, 8, 32, cache=AnalysisCache())
+    finder = ChokeFinder(game, mm)
+    finder()
+    hpa = HierarchicalPathfinder.from_choke_finder(finder, merger)
+    walkable = mm.get_walkability_map()
+
+    rng = np.random.default_rng(seed)
+    ys, xs = np.nonzero(walkable)
+    ratios = []
+    for _ in range(queries):
+        i, j = rng.integers(len(xs), size=2)
+        start, goal = (int(xs[i]), int(ys[i])), (int(xs[j]), int(ys[j]))
+        dist, parents = flood_mask(~walkable, {start}, with_parents=True)
+        path = hpa.find_path(start, goal)
+        if np.isinf(dist[goal[1], goal[0]]):
+            assert path is None
+            continue
+
+        assert path[0] == start and path[-1] == goal
+        assert all(walkable[y, x] for x, y in path)
+        assert all(max(abs(x1 - x2), abs(y1 - y2)) == 1 for (x1, y1), (x2, y2) in zip(path, path[1:]))
+
+        optimal = dist[goal[1], goal[0]]
+        owners = [hpa.owner[y, x] for x, y in trace_path(parents, *goal)]
+        bound = sum(2 * hpa.border_gaps[min(a, b), max(a, b)] + 1 for a, b in zip(owners, owners[1:]) if a != b)
+        assert path_length(path) <= optimal + bound + 1e-9
+        if optimal > 0:
+            ratios.append(path_length(path) / optimal)
+    return np.array(ratios)
+
+
+def test_paths_over_quadtree_leaves():
+    ratios = check_paths(128, None)
+    assert ratios.mean() < 1.02
+
+
+def test_paths_over_merged_rectangles():
+    for merger in (SameSideNodeMerger, GrowthNodeMerger):
+        ratios = check_paths(256, merger)
+        assert ratios.mean() < 1.02
+
+
+def test_unreachable_goal():
+    walkable = np.zeros((8, 16), dtype=np.bool_)
+    walkable[:, :6] = walkable[:, 10:] = True
+    hpa = HierarchicalPathfinder([(0, 0, 6, 8), (10, 0, 6, 8)], walkable.shape)
+    assert hpa.find_path((0, 0), (15, 7)) is None
+    assert hpa.find_path((0, 0), (5, 7)) == [(0, 0), (1, 1), (2, 2), (3, 3), (4, 4), (5, 5), (5, 6), (5, 7)]
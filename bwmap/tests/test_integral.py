@@ -0,0 +1,25 @@
+import numpy as np
+
+from ..integral import SummedAreaTable
+
+
+def test_zero_region_sums_to_zero():
+    rng = np.random.default_rng(0)
+    data = rng.random((512, 512)) * 1000
+    data[100:200, 300:400] = 0
+    sat = SummedAreaTable(data)
+    assert sat.sum(300, 100, 100, 100) == 0
+    assert sat.sum(np.arange(300, 390), np.arange(100, 190), 10, 10).tolist() == [0] * 90
+    sums = sat.window_sums(10, 10)
+    assert (sums[100:191, 300:391] == 0).all()
+    assert (sums >= 0).all()
+
+
+def test_sums_match_slices():
+    rng = np.random.default_rng(1)
+    data = rng.random((64, 48)) - 0.5
+    sat = SummedAreaTable(data)
+    sums = sat.window_sums(4, 3)
+    for y, x in rng.integers(0, 40, (20, 2)).tolist():
+        assert np.isclose(sat.sum(x, y, 4, 3), data[y:y + 3, x:x + 4].sum())
+        assert np.isclose(sums[y, x], data[y:y + 3, x:x + 4].sum())
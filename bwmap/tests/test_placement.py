@@ -0,0 +1,35 @@
+import numpy as np
+
+from ..placement import PlacementIndex
+
+
+def make_index():
+    "8x6 build tiles map without walls, 2x2 is registered, 5x1 is not"
+    return PlacementIndex(np.zeros((6, 8), dtype=np.bool_), footprints=[(2, 2)])
+
+
+def test_negative_positions():
+    index = make_index()
+    for w, h in ((2, 2), (5, 1)):
+        assert not index.can_place(-1, 0, w, h)
+        assert not index.can_place(0, -1, w, h)
+        assert not index.can_place(-1, -1, w, h)
+
+
+def test_positions_past_edge():
+    index = make_index()
+    for w, h in ((2, 2), (5, 1)):
+        assert index.can_place(8 - w, 6 - h, w, h)
+        assert not index.can_place(8 - w + 1, 0, w, h)
+        assert not index.can_place(0, 6 - h + 1, w, h)
+        assert not index.can_place(8, 6, w, h)
+        assert not index.can_place(100, 100, w, h)
+
+
+def test_registered_and_unregistered_agree():
+    index = make_index()
+    index.place(3, 2, 2, 2)
+    unregistered = PlacementIndex(index.walls, footprints=[])
+    for y in range(-2, 8):
+        for x in range(-2, 10):
+            assert index.can_place(x, y, 2, 2) == unregistered.can_place(x, y, 2, 2), (x, y)
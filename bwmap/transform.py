@@ -0,0 +1,110 @@
+from math import sqrt, inf
+
+import numpy as np
+
+
+SQ2 = sqrt(2)
+
+
+def _chamfer_pass(dist: np.ndarray):
+    """
+    Top to bottom pass of octile chamfer transform, dist is updated inplace.
+    Every row takes steps from the previous row and then
+    is relaxed horizontally in both directions at once:
+    d[x] = min(d[k] + |x - k|) = min(min(d[k] - k) + x, min(d[k] + k) - x)
+    """
+    xs = np.arange(dist.shape[1], dtype=dist.dtype)
+    for y in range(dist.shape[0]):
+        row = dist[y]
+        if y > 0:
+            prev = dist[y - 1]
+            np.minimum(row, prev + 1, out=row)
+            np.minimum(row[1:], prev[:-1] + SQ2, out=row[1:])
+            np.minimum(row[:-1], prev[1:] + SQ2, out=row[:-1])
+        np.minimum(row, np.minimum.accumulate(row - xs) + xs, out=row)
+        np.minimum(row, np.minimum.accumulate((row + xs)[::-1])[::-1] - xs, out=row)
+
+
+def chamfer_transform(mask: np.ndarray) -> np.ndarray:
+    """
+    Octile distances (straight step is 1, diagonal is sqrt(2)) from every cell
+    to the nearest True cell of boolean 2d np.array.
+    Exact for 8-connected moves, two passes over rows.
+    All cells are infinitely far if there are no True cells.
+    """
+    dist = np.where(mask, 0.0, inf)
+    _chamfer_pass(dist)
+    _chamfer_pass(dist[::-1])
+    return dist
+
+
+def _column_distances(mask: np.ndarray) -> np.ndarray:
+    "Distances to the nearest True cell in the same column"
+    dist = np.where(mask, 0.0, inf)
+    for y in range(1, dist.shape[0]):
+        np.minimum(dist[y], dist[y - 1] + 1, out=dist[y])
+    for y in range(dist.shape[0] - 2, -1, -1):
+        np.minimum(dist[y], dist[y + 1] + 1, out=dist[y])
+    return dist
+
+
+def _lower_envelope(f: np.ndarray) -> np.ndarray:
+    """
+    Squared distance transform of sampled function along rows:
+    d[x] = min(f[q] + (x - q) ** 2)
+    Felzenszwalb & Huttenlocher lower envelope of parabolas, vectorized over rows.
+    Infinite samples are skipped, rows without finite samples stay infinite.
+    """
+    nrows, n = f.shape
+    rows = np.arange(nrows)
+    v = np.zeros((nrows, n), dtype=np.intp)  # parabola vertices
+    z = np.full((nrows, n + 1), inf)  # parabola boundaries
+    k = np.full(nrows, -1)  # index of the rightmost parabola
+
+    def intersection(q, fq, r):
+        vk = v[r, k[r]]
+        return ((fq[r] + q * q) - (f[r, vk] + vk * vk)) / (2 * q - 2 * vk)
+
+    for q in range(n):
+        fq = f[:, q]
+        active = np.isfinite(fq)
+        # drop parabolas hidden by the new one
+        while True:
+            r = rows[active & (k >= 0)]
+            s = intersection(q, fq, r)
+            hidden = s <= z[r, k[r]]
+            if not hidden.any():
+                break
+            k[r[hidden]] -= 1
+
+        r = rows[active]
+        s = np.full(r.shape, -inf)
+        placed = k[r] >= 0
+        s[placed] = intersection(q, fq, r[placed])
+        k[r] += 1
+        v[r, k[r]] = q
+        z[r, k[r]] = s
+        z[r, k[r] + 1] = inf
+
+    result = np.full(f.shape, inf)
+    j = np.zeros(nrows, dtype=np.intp)
+    has = k >= 0
+    for x in range(n):
+        while True:
+            step = has & (j < k) & (z[rows, j + 1] < x)
+            if not step.any():
+                break
+            j[step] += 1
+        vj = v[rows, j]
+        result[has, x] = ((x - vj) ** 2 + f[rows, vj])[has]
+    return result
+
+
+def euclidean_transform(mask: np.ndarray) -> np.ndarray:
+    """
+    Exact euclidean distances from every cell to the nearest True cell of boolean 2d np.array.
+    Separable: distances along columns, then lower envelope of parabolas along rows.
+    All cells are infinitely far if there are no True cells.
+    """
+    columns = _column_distances(mask)
+    return np.sqrt(_lower_envelope(columns ** 2))